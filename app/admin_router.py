@@ -7,20 +7,33 @@ or X-Admin-Secret header.
 
 Endpoints:
   GET  /admin/stats                  — total docs, chunks, last ingestion
-  GET  /admin/documents              — list all documents with status + chunk count
+  GET  /admin/documents              — documents with status + chunk count (keyset-paginated, filterable)
   DELETE /admin/documents/{doc_id}   — delete document + all its chunks
-  POST /admin/documents/{doc_id}/reingest  — mark failed doc for re-ingestion (resets status)
+  POST /admin/documents/{doc_id}/reingest  — mark failed doc for re-ingestion (resets status; ?incremental=true keeps chunks live)
+  POST /admin/bm25/refresh           — sync the in-process BM25 index with document_chunks
+  GET  /admin/metrics                — stage latencies, pool and cache stats (Prometheus text)
 """
 
 import os
-from fastapi import APIRouter, HTTPException, Query, Header
+import base64
+import orjson
+from fastapi import APIRouter, HTTPException, Query, Header, Response
+from fastapi.responses import PlainTextResponse
 from typing import Optional
 
-from app.db import get_db_connection, release_db_connection
+from app.db import get_db_connection, release_db_connection, pool_stats
+from app.cache import invalidate_document, answer_cache
+from app.bm25 import bm25_index, refresh_bm25_index
+from app.metrics import render_prometheus
+from app.retrieval_core import embedding_cache_stats
+from app.final_retreval import rerank_stats
+from app.query_rewrite import rewrite_cache_stats
+from app.conversation_store import conversation_store
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
-ADMIN_SECRET = os.getenv("ADMIN_SECRET", "nova-admin-2025")
+ADMIN_SECRET        = os.getenv("ADMIN_SECRET", "nova-admin-2025")
+DOCUMENTS_PAGE_SIZE = int(os.getenv("ADMIN_DOCUMENTS_PAGE_SIZE", "200"))
 
 
 # ── Auth helper ───────────────────────────────────────────────────────────────
@@ -41,38 +54,25 @@ def get_stats(
     secret: Optional[str] = Query(None),
     x_admin_secret: Optional[str] = Header(None),
 ):
+    """Reads the trigger-maintained counters (sql/admin_counters.sql) — one cheap round trip."""
     verify_auth(secret, x_admin_secret)
     conn = get_db_connection()
     try:
         cur = conn.cursor()
-
-        cur.execute("SELECT COUNT(*) FROM documents WHERE status = 'done'")
-        total_docs = cur.fetchone()[0]
-
-        cur.execute("SELECT COUNT(*) FROM document_chunks")
-        total_chunks = cur.fetchone()[0]
-
-        cur.execute(
-            "SELECT COUNT(*) FROM documents WHERE status = 'processing'"
-        )
-        processing = cur.fetchone()[0]
-
-        cur.execute(
-            "SELECT COUNT(*) FROM documents WHERE status = 'failed'"
-        )
-        failed = cur.fetchone()[0]
-
-        cur.execute(
-            "SELECT MAX(updated_at) FROM documents WHERE status = 'done'"
-        )
-        last_ingestion = cur.fetchone()[0]
-
+        cur.execute("""
+            SELECT
+                (SELECT json_object_agg(name, value) FROM corpus_counters),
+                (SELECT MAX(updated_at) FROM documents WHERE status = 'done')
+        """)
+        counters, last_ingestion = cur.fetchone()
         cur.close()
+        counters = counters or {}
+
         return {
-            "total_docs":      total_docs,
-            "total_chunks":    total_chunks,
-            "processing":      processing,
-            "failed":          failed,
+            "total_docs":      counters.get("documents:done", 0),
+            "total_chunks":    counters.get("chunks", 0),
+            "processing":      counters.get("documents:processing", 0),
+            "failed":          counters.get("documents:failed", 0),
             "last_ingestion":  last_ingestion.isoformat() if last_ingestion else None,
         }
     finally:
@@ -81,47 +81,84 @@ def get_stats(
 
 # ── GET /admin/documents ──────────────────────────────────────────────────────
 
+def _encode_cursor(updated_at, document_id) -> str:
+    raw = f"{updated_at.isoformat()}|{document_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        updated_at, document_id = raw.split("|", 1)
+        return updated_at, document_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/documents")
 def list_documents(
     secret: Optional[str] = Query(None),
     x_admin_secret: Optional[str] = Header(None),
+    limit: int = Query(DOCUMENTS_PAGE_SIZE, ge=1, le=1000),
+    cursor: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    search: Optional[str] = Query(None),
 ):
+    """
+    Most recently updated first, keyset-paginated: pass the X-Next-Cursor
+    response header back as ?cursor= for the next page (absent on the last
+    page). Filter by exact ?status= and/or document name ?search= substring.
+    """
     verify_auth(secret, x_admin_secret)
+
+    where, params = [], []
+    if status:
+        where.append("status = %s")
+        params.append(status)
+    if search:
+        where.append("document_name ILIKE %s")
+        params.append(f"%{search}%")
+    if cursor:
+        where.append("(updated_at, document_id) < (%s::timestamptz, %s::uuid)")
+        params.extend(_decode_cursor(cursor))
+
     conn = get_db_connection()
     try:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT
-                d.document_id,
-                d.document_name,
-                d.status,
-                d.error_message,
-                d.created_at,
-                d.updated_at,
-                COUNT(c.id) AS chunk_count
-            FROM documents d
-            LEFT JOIN document_chunks c ON c.document_id = d.document_id
-            GROUP BY d.document_id
-            ORDER BY d.updated_at DESC
-        """)
+        cur.execute(f"""
+            SELECT document_id, document_name, status, error_message,
+                   created_at, updated_at, chunk_count
+            FROM documents
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY updated_at DESC, document_id DESC
+            LIMIT %s
+        """, (*params, limit + 1))
         rows = cur.fetchall()
         cur.close()
-
-        return [
-            {
-                "document_id":   str(row[0]),
-                "document_name": row[1],
-                "status":        row[2],
-                "error_message": row[3],
-                "created_at":    row[4].isoformat() if row[4] else None,
-                "updated_at":    row[5].isoformat() if row[5] else None,
-                "chunk_count":   row[6],
-            }
-            for row in rows
-        ]
     finally:
         release_db_connection(conn)
 
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = _encode_cursor(rows[-1][5], rows[-1][0])
+
+    # orjson serializes UUIDs/datetimes natively and is several times faster
+    # than the stdlib encoder on large listings
+    body = orjson.dumps([
+        {
+            "document_id":   row[0],
+            "document_name": row[1],
+            "status":        row[2],
+            "error_message": row[3],
+            "created_at":    row[4],
+            "updated_at":    row[5],
+            "chunk_count":   row[6],
+        }
+        for row in rows
+    ])
+    return Response(content=body, media_type="application/json", headers=headers)
+
 
 # ── DELETE /admin/documents/{doc_id} ─────────────────────────────────────────
 
@@ -153,11 +190,16 @@ def delete_document(
         )
         chunks_deleted = cur.rowcount
 
+        # The BM25 index is keyed on the stored id, which may be spelled
+        # differently from the path segment (case, braces)
         cur.execute(
-            "DELETE FROM documents WHERE document_id = %s", (doc_id,)
+            "DELETE FROM documents WHERE document_id = %s RETURNING document_id::text", (doc_id,)
         )
+        document_id = cur.fetchone()[0]
         conn.commit()
         cur.close()
+        invalidate_document(doc_name)
+        bm25_index.remove_document(document_id)
 
         return {
             "deleted":        True,
@@ -173,6 +215,7 @@ def delete_document(
 @router.post("/documents/{doc_id}/reingest")
 def mark_for_reingest(
     doc_id: str,
+    incremental: bool = Query(False),
     secret: Optional[str] = Query(None),
     x_admin_secret: Optional[str] = Header(None),
 ):
@@ -180,6 +223,10 @@ def mark_for_reingest(
     Resets a document's status to 'pending_reingest' and clears its chunks
     so the Colab ingestion notebook can pick it up on the next run.
     The fingerprint is also cleared so the duplicate-check doesn't skip it.
+
+    With ?incremental=true the chunks stay live and the document is marked
+    'pending_update': the next ingestion run diffs the new version against
+    them and swaps in only what changed, in one transaction.
     """
     verify_auth(secret, x_admin_secret)
     conn = get_db_connection()
@@ -196,6 +243,32 @@ def mark_for_reingest(
 
         doc_name = row[0]
 
+        if incremental:
+            cur.execute(
+                """
+                UPDATE documents
+                SET status        = 'pending_update',
+                    error_message = NULL,
+                    updated_at    = now()
+                WHERE document_id = %s
+                """,
+                (doc_id,)
+            )
+            conn.commit()
+            cur.close()
+            # The chunks change when ingestion applies the update, in another
+            # process; the document poll invalidates again then
+            invalidate_document(doc_name)
+            return {
+                "document_name":  doc_name,
+                "chunks_cleared": 0,
+                "status":         "pending_update",
+                "message": (
+                    "Document marked for incremental update. Its chunks stay searchable; "
+                    "the next ingestion run replaces only the chunks that changed."
+                ),
+            }
+
         # Clear chunks so re-ingestion inserts fresh ones
         cur.execute(
             "DELETE FROM document_chunks WHERE document_id = %s", (doc_id,)
@@ -211,11 +284,15 @@ def mark_for_reingest(
                 error_message = NULL,
                 updated_at    = now()
             WHERE document_id = %s
+            RETURNING document_id::text
             """,
             (doc_id,)
         )
+        document_id = cur.fetchone()[0]
         conn.commit()
         cur.close()
+        invalidate_document(doc_name)
+        bm25_index.remove_document(document_id)
 
         return {
             "document_name":  doc_name,
@@ -227,4 +304,70 @@ def mark_for_reingest(
             ),
         }
     finally:
-        release_db_connection(conn)
\ No newline at end of file
+        release_db_connection(conn)
+
+
+# ── POST /admin/bm25/refresh ──────────────────────────────────────────────────
+
+@router.post("/bm25/refresh")
+async def refresh_bm25(
+    secret: Optional[str] = Query(None),
+    x_admin_secret: Optional[str] = Header(None),
+):
+    """Loads newly ingested documents into the BM25 index and drops deleted ones."""
+    verify_auth(secret, x_admin_secret)
+    return await refresh_bm25_index()
+
+
+# ── GET /admin/metrics ────────────────────────────────────────────────────────
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(
+    secret: Optional[str] = Query(None),
+    x_admin_secret: Optional[str] = Header(None),
+):
+    """Prometheus text exposition: per-stage latency histograms + p50/p95/p99, pools, caches."""
+    verify_auth(secret, x_admin_secret)
+
+    pool_info = pool_stats()
+    pools = [
+        ({"pool": name, "state": state}, pool[state])
+        for name, pool in pool_info.items() for state in ("in_use", "idle", "max")
+    ]
+
+    def per_pool(field):
+        return [({"pool": name}, pool[field]) for name, pool in pool_info.items() if field in pool]
+
+    recycled = [
+        ({"pool": name, "reason": reason}, pool[f"recycled_{reason}"])
+        for name, pool in pool_info.items() for reason in ("age", "idle", "broken")
+        if f"recycled_{reason}" in pool
+    ]
+
+    rerank = rerank_stats()
+    caches = {
+        "answer":       answer_cache.stats(),
+        "embedding":    embedding_cache_stats(),
+        "rerank":       rerank.pop("cache"),
+        "rewrite":      rewrite_cache_stats(),
+        "conversation": conversation_store.stats(),
+    }
+
+    def per_cache(field):
+        return [({"cache": name}, stats[field]) for name, stats in caches.items()]
+
+    return render_prometheus([
+        ("nova_db_pool_connections", "gauge", "Database pool connections by state.", pools),
+        ("nova_db_pool_checkouts_total", "counter", "Connection checkouts.", per_pool("checkouts")),
+        ("nova_db_pool_timeouts_total", "counter", "Checkouts that gave up after DB_POOL_TIMEOUT.", per_pool("timeouts")),
+        ("nova_db_pool_recycled_total", "counter", "Connections closed by the pool, by reason.", recycled),
+        ("nova_cache_entries", "gauge", "Entries held per cache.", per_cache("entries")),
+        ("nova_cache_hits_total", "counter", "Cache hits.", per_cache("hits")),
+        ("nova_cache_misses_total", "counter", "Cache misses.", per_cache("misses")),
+        ("nova_cache_evictions_total", "counter", "Entries evicted for capacity.", per_cache("evictions")),
+        ("nova_cache_expirations_total", "counter", "Entries dropped after their TTL.", per_cache("expirations")),
+        ("nova_rerank_total", "counter", "Rerank outcomes (executed, cached, skipped).",
+         [({"outcome": outcome}, count) for outcome, count in rerank.items()]),
+        ("nova_bm25_index", "gauge", "In-process BM25 index size.",
+         [({"field": field}, value) for field, value in bm25_index.stats().items()]),
+    ])
@@ -0,0 +1,282 @@
+"""
+In-process BM25 index over document_chunks
+==========================================
+Alternative to the Postgres ts_rank leg of hybrid search (LEXICAL_BACKEND=bm25).
+Built once at startup from document_chunks, then kept in sync incrementally:
+admin deletes/re-ingests drop a document's chunks immediately, and refresh()
+picks up documents added by the ingestion pipeline and reloads ones whose
+documents.updated_at moved (incremental updates change chunks in place).
+
+Layout: each term maps to two parallel arrays (chunk numbers, term frequencies),
+appended in chunk order so postings stay sorted. Document lengths live in a
+flat array; IDF and per-term score upper bounds are recomputed after each
+batch change. Removed chunks are tombstoned and the postings are compacted
+once tombstones pass COMPACT_RATIO.
+
+Scoring is term-at-a-time in descending upper-bound order with early
+termination: once the k-th best score beats the sum of the remaining terms'
+upper bounds, no unseen chunk can enter the top-k, so we stop admitting new
+candidates and only finish scoring the ones we have.
+"""
+
+import os
+import re
+import math
+import heapq
+import threading
+from array import array
+
+from app.db import fetch
+
+LEXICAL_BACKEND = os.getenv("LEXICAL_BACKEND", "tsvector")  # "tsvector" → Postgres ts_rank, "bm25" → this index
+BM25_K1         = 1.2
+BM25_B          = 0.75
+COMPACT_RATIO   = 0.2
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from has have how i if in into is it its
+me my of on or our so than that the their them then there these they this those to was
+we were what when where which who why will with you your about also any
+""".split())
+
+
+def _stem(token: str) -> str:
+    # Plural folding only — enough for "fees"/"fee", "hostels"/"hostel"
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    return [_stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ready = False
+        self.loaded_versions: dict[str, str] = {}   # document_id → documents.updated_at when loaded
+        self._reset()
+
+    def _reset(self):
+        self.items: list[dict | None] = []                 # chunk number → item, None once removed
+        self.doc_len      = array("I")
+        self.doc_owner: list[str] = []                     # chunk number → document_id
+        self.doc_terms: list[tuple[str, ...]] = []         # chunk number → distinct terms (for df upkeep)
+        self.by_document: dict[str, list[int]] = {}
+        self.postings: dict[str, tuple[array, array]] = {}
+        self.df: dict[str, int]       = {}
+        self.max_tf: dict[str, int]   = {}
+        self.idf: dict[str, float]    = {}
+        self.bound: dict[str, float]  = {}
+        self.live         = 0
+        self.total_len    = 0
+        self._avgdl       = 1.0
+
+    # ── Mutation ──────────────────────────────────────────────────────────────
+
+    def add_rows(self, rows) -> int:
+        """Adds (document_id, chunk_id, text, metadata) rows. Returns chunks added."""
+        with self._lock:
+            added = 0
+            for document_id, chunk_id, text, metadata in rows:
+                self._add(document_id, {"chunk_id": chunk_id, "text": text, "metadata": metadata})
+                added += 1
+            self._recompute_stats()
+            return added
+
+    def remove_document(self, document_id: str) -> int:
+        """Tombstones every chunk of a document. Returns chunks removed."""
+        with self._lock:
+            removed = self._remove(document_id)
+            if removed:
+                self._maybe_compact()
+                self._recompute_stats()
+            return removed
+
+    def replace_documents(self, stale: set[str], rows, versions: dict[str, str]) -> tuple[int, int]:
+        """
+        Drops `stale` documents and adds `rows` under one lock hold, so a search
+        never sees an updated document half-replaced. Returns (removed, added).
+        """
+        with self._lock:
+            removed = sum(self._remove(document_id) for document_id in stale)
+            added = 0
+            for document_id, chunk_id, text, metadata in rows:
+                self._add(document_id, {"chunk_id": chunk_id, "text": text, "metadata": metadata})
+                added += 1
+            self.loaded_versions.update(versions)
+            self._maybe_compact()
+            self._recompute_stats()
+            return removed, added
+
+    def _remove(self, document_id: str) -> int:
+        self.loaded_versions.pop(document_id, None)
+        removed = 0
+        for n in self.by_document.pop(document_id, []):
+            if self.items[n] is None:
+                continue
+            self.items[n] = None
+            self.live -= 1
+            self.total_len -= self.doc_len[n]
+            for term in self.doc_terms[n]:
+                self.df[term] -= 1
+            removed += 1
+        return removed
+
+    def _maybe_compact(self):
+        tombstones = len(self.items) - self.live
+        if tombstones and tombstones > COMPACT_RATIO * len(self.items):
+            self._compact()
+
+    def documents(self) -> set[str]:
+        return set(self.by_document)
+
+    def _add(self, document_id: str, item: dict):
+        n = len(self.items)
+        tokens = tokenize(item["text"])
+        counts: dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+
+        self.items.append(item)
+        self.doc_len.append(len(tokens))
+        self.doc_owner.append(document_id)
+        self.doc_terms.append(tuple(counts))
+        self.by_document.setdefault(document_id, []).append(n)
+
+        for term, tf in counts.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = (array("I"), array("I"))
+            posting[0].append(n)
+            posting[1].append(tf)
+            self.df[term] = self.df.get(term, 0) + 1
+            if tf > self.max_tf.get(term, 0):
+                self.max_tf[term] = tf
+
+        self.live += 1
+        self.total_len += len(tokens)
+
+    def _compact(self):
+        """Rebuilds postings without tombstones and renumbers chunks."""
+        survivors = [
+            (self.doc_owner[n], item) for n, item in enumerate(self.items) if item is not None
+        ]
+        self._reset()
+        for document_id, item in survivors:
+            self._add(document_id, item)
+
+    def _recompute_stats(self):
+        n = max(self.live, 1)
+        avgdl = self.total_len / n if self.live else 1.0
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in self.df.items() if df > 0
+        }
+        # Score upper bound per term: max tf at the shortest possible length (norm → k1·(1-b))
+        self.bound = {
+            term: idf * self.max_tf[term] * (BM25_K1 + 1)
+                  / (self.max_tf[term] + BM25_K1 * (1 - BM25_B))
+            for term, idf in self.idf.items()
+        }
+        self._avgdl = avgdl or 1.0
+        self.ready = True
+
+    # ── Query ─────────────────────────────────────────────────────────────────
+
+    def search(self, query: str, k: int = 20) -> list[tuple]:
+        """Top-k chunks by BM25 → [(chunk_id, text, metadata, score)] best first."""
+        with self._lock:
+            terms = sorted(
+                {t for t in tokenize(query) if t in self.idf},
+                key=lambda t: self.bound[t], reverse=True,
+            )
+            if not terms:
+                return []
+
+            remaining = sum(self.bound[t] for t in terms)
+            scores: dict[int, float] = {}
+            admit_new = True
+            k1, b, avgdl = BM25_K1, BM25_B, self._avgdl
+            items, doc_len = self.items, self.doc_len
+
+            for term in terms:
+                idf = self.idf[term]
+                remaining -= self.bound[term]
+                chunk_numbers, tfs = self.postings[term]
+                for n, tf in zip(chunk_numbers, tfs):
+                    if items[n] is None:
+                        continue
+                    if not admit_new and n not in scores:
+                        continue
+                    norm = k1 * (1 - b + b * doc_len[n] / avgdl)
+                    scores[n] = scores.get(n, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+
+                if admit_new and len(scores) >= k:
+                    kth = heapq.nlargest(k, scores.values())[-1]
+                    if kth >= remaining:
+                        admit_new = False
+
+            top = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+            return [
+                (items[n]["chunk_id"], items[n]["text"], items[n]["metadata"], score)
+                for n, score in top
+            ]
+
+    def stats(self) -> dict:
+        return {
+            "chunks":     self.live,
+            "tombstones": len(self.items) - self.live,
+            "terms":      len(self.idf),
+            "documents":  len(self.by_document),
+        }
+
+
+bm25_index = BM25Index()
+
+
+# ── Loading ───────────────────────────────────────────────────────────────────
+
+DOCUMENT_VERSIONS_SQL = """
+    SELECT d.document_id::text, d.updated_at::text
+    FROM documents d
+    WHERE EXISTS (SELECT 1 FROM document_chunks c WHERE c.document_id = d.document_id)
+"""
+
+CHUNK_ROWS_SQL = """
+    SELECT document_id::text, chunk_id, text, metadata
+    FROM document_chunks
+    WHERE document_id = ANY($1::uuid[])
+    ORDER BY document_id, chunk_id
+"""
+
+
+async def refresh_bm25_index() -> dict:
+    """
+    Syncs the index with document_chunks by document: loads documents that
+    aren't indexed yet, reloads ones whose updated_at changed since they were
+    loaded, and drops ones that no longer have chunks. The first call builds
+    the whole index.
+    """
+    rows = await fetch(DOCUMENT_VERSIONS_SQL)
+    in_db   = {row[0]: row[1] for row in rows}
+    indexed = dict(bm25_index.loaded_versions)
+    indexed.update({doc_id: None for doc_id in bm25_index.documents() - indexed.keys()})
+
+    gone    = indexed.keys() - in_db.keys()
+    changed = {doc_id for doc_id in indexed.keys() & in_db.keys() if indexed[doc_id] != in_db[doc_id]}
+    load    = sorted((in_db.keys() - indexed.keys()) | changed)
+
+    chunk_rows = await fetch(CHUNK_ROWS_SQL, load) if load else []
+    removed, added = bm25_index.replace_documents(gone | changed, chunk_rows, {doc_id: in_db[doc_id] for doc_id in load})
+    return {
+        "added_chunks":      added,
+        "removed_chunks":    removed,
+        "updated_documents": len(changed),
+        **bm25_index.stats(),
+    }
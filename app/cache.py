@@ -0,0 +1,120 @@
+"""
+Bounded in-process caches.
+
+TTLCache is an LRU map with a per-entry time-to-live and an optional byte
+budget. Everything is O(1) per operation (OrderedDict move/pop), and the
+lock is only held for dict bookkeeping — never across network calls.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """LRU cache with per-entry TTL, entry cap, optional byte cap and hit/miss counters."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0,
+                 max_bytes: int | None = None, sizeof=None):
+        self.max_entries = max_entries
+        self.ttl         = ttl
+        self.max_bytes   = max_bytes
+        self._sizeof     = sizeof or (lambda value: 0)
+        self._data: OrderedDict = OrderedDict()   # key → (expires_at, size, value)
+        self._bytes      = 0
+        self._lock       = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, value) -> None:
+        size = self._sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return  # never cacheable — don't flush everything else for it
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            self._remove(key)
+            return entry[2]
+
+    def invalidate(self, predicate) -> int:
+        """Drops every entry for which predicate(key, value) is true. Returns the count."""
+        with self._lock:
+            doomed = [k for k, (_, _, v) in self._data.items() if predicate(k, v)]
+            for key in doomed:
+                self._remove(key)
+            return len(doomed)
+
+    def sweep(self) -> int:
+        """Drops expired entries. Returns the count."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (exp, _, _) in self._data.items() if exp <= now]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+            return len(expired)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries":     len(self._data),
+            "bytes":       self._bytes,
+            "hits":        self.hits,
+            "misses":      self.misses,
+            "evictions":   self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, key) -> None:
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+
+# ── Answer cache ──────────────────────────────────────────────────────────────
+# Shared by /chat, /chat/stream (fill) and the admin router (invalidation).
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL  = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+answer_cache = TTLCache(max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+
+
+def invalidate_document(document_name: str) -> int:
+    """Drops cached answers whose retrieval context touched the given document."""
+    return answer_cache.invalidate(lambda _, entry: document_name in entry["documents"])
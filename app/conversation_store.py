@@ -0,0 +1,134 @@
+"""
+Conversation state for follow-up handling
+=========================================
+Stores {"last_query", "last_answer"} per conversation_id.
+
+CONVERSATION_STORE=memory   (default) bounded LRU + TTL map, per process
+CONVERSATION_STORE=postgres shared `conversations` table — works across
+                            uvicorn workers and Railway replicas
+
+Both expire idle conversations after CONVERSATION_TTL seconds; the app runs
+sweep() every CONVERSATION_SWEEP_SECONDS to reclaim them eagerly.
+"""
+
+import os
+from abc import ABC, abstractmethod
+
+from app.cache import TTLCache
+from app.db import fetch, get_async_pool
+
+CONVERSATION_STORE         = os.getenv("CONVERSATION_STORE", "memory")
+CONVERSATION_MAX           = int(os.getenv("CONVERSATION_MAX", "10000"))
+CONVERSATION_TTL           = float(os.getenv("CONVERSATION_TTL", "3600"))
+CONVERSATION_SWEEP_SECONDS = float(os.getenv("CONVERSATION_SWEEP_SECONDS", "60"))
+
+
+class ConversationStore(ABC):
+    """Interface — get/put are O(1) in every backend. A backend missing a method fails at instantiation."""
+
+    async def setup(self):
+        pass
+
+    @abstractmethod
+    async def get(self, cid: str) -> dict | None: ...
+
+    @abstractmethod
+    async def put(self, cid: str, state: dict) -> None: ...
+
+    @abstractmethod
+    async def sweep(self) -> int:
+        """Removes expired conversations. Returns the count."""
+
+    @abstractmethod
+    def stats(self) -> dict: ...
+
+
+class MemoryConversationStore(ConversationStore):
+    def __init__(self, max_entries: int = CONVERSATION_MAX, ttl: float = CONVERSATION_TTL):
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    async def get(self, cid: str) -> dict | None:
+        return self._cache.get(cid)
+
+    async def put(self, cid: str, state: dict) -> None:
+        self._cache.put(cid, state)
+
+    async def sweep(self) -> int:
+        return self._cache.sweep()
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class PostgresConversationStore(ConversationStore):
+    SCHEMA_SQL = """
+        CREATE TABLE IF NOT EXISTS conversations (
+            conversation_id TEXT PRIMARY KEY,
+            state           JSONB NOT NULL,
+            expires_at      TIMESTAMPTZ NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS conversations_expires_at_idx ON conversations (expires_at);
+    """
+
+    def __init__(self, ttl: float = CONVERSATION_TTL):
+        self.ttl = ttl
+        self.hits = self.misses = self.writes = self.expirations = 0
+        self.entries = 0  # refreshed on each sweep
+
+    async def setup(self):
+        async_pool = await get_async_pool()
+        async with async_pool.acquire() as conn:
+            await conn.execute(self.SCHEMA_SQL)
+
+    async def get(self, cid: str) -> dict | None:
+        rows = await fetch(
+            "SELECT state FROM conversations WHERE conversation_id = $1 AND expires_at > now()",
+            cid,
+        )
+        if rows:
+            self.hits += 1
+            return rows[0][0]
+        self.misses += 1
+        return None
+
+    async def put(self, cid: str, state: dict) -> None:
+        await fetch("""
+            INSERT INTO conversations (conversation_id, state, expires_at)
+            VALUES ($1, $2, now() + make_interval(secs => $3))
+            ON CONFLICT (conversation_id)
+            DO UPDATE SET state = EXCLUDED.state, expires_at = EXCLUDED.expires_at
+        """, cid, state, self.ttl)
+        self.writes += 1
+
+    async def sweep(self) -> int:
+        rows = await fetch("""
+            WITH expired AS (
+                DELETE FROM conversations WHERE expires_at <= now() RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM expired), (SELECT COUNT(*) FROM conversations)
+        """)
+        expired, remaining = rows[0]
+        self.expirations += expired
+        self.entries = remaining - expired  # the outer COUNT still sees the deleted rows
+        return expired
+
+    def stats(self) -> dict:
+        return {
+            "backend":     "postgres",
+            "entries":     self.entries,
+            "hits":        self.hits,
+            "misses":      self.misses,
+            "writes":      self.writes,
+            "evictions":   0,
+            "expirations": self.expirations,
+        }
+
+
+def create_conversation_store() -> ConversationStore:
+    if CONVERSATION_STORE == "postgres":
+        return PostgresConversationStore()
+    return MemoryConversationStore()
+
+
+# Bounded LRU/TTL in memory by default; CONVERSATION_STORE=postgres shares it across workers
+conversation_store = create_conversation_store()
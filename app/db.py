@@ -1,36 +1,303 @@
 import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+
+import asyncpg
 import psycopg2
-from psycopg2 import pool, OperationalError
+from psycopg2 import extensions
 from dotenv import load_dotenv
 
+from app.metrics import observe
+
 load_dotenv()
 
 DSN = os.getenv("SUPABASE_URL")
 
-db_pool = pool.ThreadedConnectionPool(minconn=1, maxconn=20, dsn=DSN)
+DB_POOL_MIN         = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX         = int(os.getenv("DB_POOL_MAX", "20"))
+DB_POOL_TIMEOUT     = float(os.getenv("DB_POOL_TIMEOUT", "10"))     # max seconds to wait for a free connection
+DB_POOL_MAX_AGE     = float(os.getenv("DB_POOL_MAX_AGE", "1800"))   # recycle connections older than this
+DB_POOL_MAX_IDLE    = float(os.getenv("DB_POOL_MAX_IDLE", "300"))   # close surplus connections idle this long
+DB_POOL_STALE_AFTER = float(os.getenv("DB_POOL_STALE_AFTER", "30")) # ping only connections idle this long
 
+ASYNC_POOL_MIN = int(os.getenv("ASYNC_DB_POOL_MIN", "2"))
+ASYNC_POOL_MAX = int(os.getenv("ASYNC_DB_POOL_MAX", "20"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))  # HNSW candidate list size — recall vs latency
+VECTOR_SHORTLIST = int(os.getenv("VECTOR_SHORTLIST", "100"))  # two-pass search: first-pass candidates re-scored at full dims
+# An HNSW scan returns at most ef_search rows, so a LIMIT above it silently
+# truncates the two-pass shortlist — the chat pool never runs below the shortlist.
+SEARCH_EF_SEARCH = max(HNSW_EF_SEARCH, VECTOR_SHORTLIST)
+# asyncpg prepares each distinct statement once per connection and reuses it. Turn
+# off behind a transaction-mode pooler (pgbouncer / Supabase port 6543).
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "1") == "1"
+STATEMENT_CACHE_SIZE   = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
 
-def get_db_connection():
-    conn = db_pool.getconn()
-    try:
-        # Cheap ping — if connection is dead this raises OperationalError
-        conn.cursor().execute("SELECT 1")
+
+class PoolTimeout(Exception):
+    """No connection became free within DB_POOL_TIMEOUT."""
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe psycopg2 pool.
+
+    - Never opens more than maxconn connections; callers wait up to `timeout`
+      for one to be returned and get PoolTimeout after that.
+    - Connections are opened lazily and handed out LIFO, so surplus ones sit
+      idle, pass max_idle and get closed (down to minconn).
+    - Connections older than max_age are closed on checkout/return.
+    - Only connections idle longer than stale_after are pinged before use.
+    """
+
+    def __init__(self, dsn: str, minconn: int, maxconn: int, timeout: float,
+                 max_age: float, max_idle: float, stale_after: float):
+        self.dsn         = dsn
+        self.minconn     = minconn
+        self.maxconn     = maxconn
+        self.timeout     = timeout
+        self.max_age     = max_age
+        self.max_idle    = max_idle
+        self.stale_after = stale_after
+        self._idle: deque = deque()        # (conn, created_at, last_used) — most recently used at the right
+        self._in_use: dict[int, tuple] = {}  # id(conn) → (conn, created_at)
+        self._size = 0                     # open connections, idle + in use + being opened
+        self._cond = threading.Condition()
+        self.counters = {
+            "checkouts": 0, "timeouts": 0, "opened": 0, "pings": 0,
+            "recycled_age": 0, "recycled_idle": 0, "recycled_broken": 0,
+        }
+
+    def getconn(self, timeout: float | None = None):
+        started = time.perf_counter()
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        doomed, conn, created, stale = [], None, None, False
+        with self._cond:
+            while conn is None:
+                now = time.monotonic()
+                while self._idle:
+                    candidate, born, last_used = self._idle.pop()
+                    if candidate.closed:
+                        self._retire(candidate, "recycled_broken", doomed)
+                        continue
+                    if now - born > self.max_age:
+                        self._retire(candidate, "recycled_age", doomed)
+                        continue
+                    conn, created, stale = candidate, born, now - last_used > self.stale_after
+                    break
+                if conn is not None:
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1  # reserve the slot; connect outside the lock
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.counters["timeouts"] += 1
+                    raise PoolTimeout(f"no database connection free within {self.timeout:g}s")
+                self._cond.wait(remaining)
+            self._expire_idle(doomed)
+
+        for old in doomed:
+            _close_quietly(old)
+
+        if conn is not None and stale and not self._ping(conn):
+            with self._cond:
+                self.counters["recycled_broken"] += 1
+            _close_quietly(conn)
+            conn = None  # reuse the slot for a fresh connection
+        if conn is None:
+            conn, created = self._open(), time.monotonic()
+
+        with self._cond:
+            self._in_use[id(conn)] = (conn, created)
+            self.counters["checkouts"] += 1
+        observe("db_checkout_sync", time.perf_counter() - started)
         return conn
-    except OperationalError:
-        # Dead connection — close it and open a fresh one directly
+
+    def putconn(self, conn):
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            _close_quietly(conn)  # not ours
+            return
+
+        reusable = not conn.closed
+        if reusable:
+            try:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    reusable = False
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except Exception:
+                reusable = False
+
+        with self._cond:
+            created = entry[1]
+            if not reusable:
+                self._retire(conn, "recycled_broken")
+            elif time.monotonic() - created > self.max_age:
+                self._retire(conn, "recycled_age")
+            else:
+                self._idle.append((conn, created, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            _close_quietly(conn)
+
+    def _open(self):
         try:
-            conn.close()
+            conn = psycopg2.connect(self.dsn)
         except Exception:
-            pass
-        return psycopg2.connect(DSN)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.counters["opened"] += 1
+        return conn
+
+    def _ping(self, conn) -> bool:
+        with self._cond:
+            self.counters["pings"] += 1
+        try:
+            conn.cursor().execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
 
+    def _retire(self, conn, reason: str, doomed: list | None = None):
+        """Drops a connection from the pool (lock held). Closed by the caller or here."""
+        self._size -= 1
+        self.counters[reason] += 1
+        if doomed is not None:
+            doomed.append(conn)
+        self._cond.notify()
 
-def release_db_connection(conn):
+    def _expire_idle(self, doomed: list):
+        # Oldest-used connections sit at the left; keep at least minconn open
+        now = time.monotonic()
+        while self._idle and self._size > self.minconn and now - self._idle[0][2] > self.max_idle:
+            conn, _, _ = self._idle.popleft()
+            self._retire(conn, "recycled_idle", doomed)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "in_use": len(self._in_use),
+                "idle":   len(self._idle),
+                "max":    self.maxconn,
+                **self.counters,
+            }
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+        for conn, _, _ in idle:
+            _close_quietly(conn)
+
+
+def _close_quietly(conn):
     try:
-        db_pool.putconn(conn)
+        conn.close()
     except Exception:
-        # conn was a direct fallback connection, just close it
-        try:
-            conn.close()
-        except Exception:
-            pass
\ No newline at end of file
+        pass
+
+
+# Sync pool — admin endpoints and the ingestion pipeline. Connects lazily.
+db_pool = ConnectionPool(
+    DSN, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+    max_age=DB_POOL_MAX_AGE, max_idle=DB_POOL_MAX_IDLE, stale_after=DB_POOL_STALE_AFTER,
+)
+
+# Async pool — the chat request path. Created on app startup (or first use in scripts).
+_async_pool: asyncpg.Pool | None = None
+_async_pool_lock = asyncio.Lock()
+_async_born: dict[int, float] = {}   # backend pid → connection opened at
+async_counters = {"checkouts": 0, "timeouts": 0, "recycled_age": 0}
+
+
+def get_db_connection():
+    """Checks out a pooled connection. Raises PoolTimeout if none frees up in time."""
+    return db_pool.getconn()
+
+
+def release_db_connection(conn):
+    db_pool.putconn(conn)
+
+
+# ── Async pool ────────────────────────────────────────────────────────────────
+
+async def _init_async_connection(conn):
+    if len(_async_born) > 4 * ASYNC_POOL_MAX:
+        # Forget connections asyncpg closed on its own (oldest first)
+        for pid in sorted(_async_born, key=_async_born.get)[:len(_async_born) - 2 * ASYNC_POOL_MAX]:
+            del _async_born[pid]
+    _async_born[conn.get_server_pid()] = time.monotonic()
+    # Decode jsonb straight to dicts so rows look the same as psycopg2's
+    await conn.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+
+async def get_async_pool() -> asyncpg.Pool:
+    global _async_pool
+    if _async_pool is None:
+        async with _async_pool_lock:
+            if _async_pool is None:
+                _async_pool = await asyncpg.create_pool(
+                    DSN, min_size=ASYNC_POOL_MIN, max_size=ASYNC_POOL_MAX,
+                    init=_init_async_connection,
+                    # A startup parameter, not a SET: asyncpg runs RESET ALL on every
+                    # release, which restores session defaults, so this survives it
+                    server_settings={"hnsw.ef_search": str(SEARCH_EF_SEARCH)},
+                    max_inactive_connection_lifetime=DB_POOL_MAX_IDLE,
+                    statement_cache_size=STATEMENT_CACHE_SIZE if DB_PREPARED_STATEMENTS else 0,
+                )
+    return _async_pool
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+
+async def fetch(sql: str, *args) -> list:
+    """Runs one query on a pooled async connection and returns all rows."""
+    async_pool = await get_async_pool()
+    started = time.perf_counter()
+    try:
+        conn = await async_pool.acquire(timeout=DB_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        async_counters["timeouts"] += 1
+        raise PoolTimeout(f"no database connection free within {DB_POOL_TIMEOUT:g}s")
+    async_counters["checkouts"] += 1
+    observe("db_checkout", time.perf_counter() - started)
+    try:
+        return await conn.fetch(sql, *args)
+    finally:
+        # asyncpg recycles idle connections itself; age is on us
+        pid = conn.get_server_pid()
+        if time.monotonic() - _async_born.get(pid, time.monotonic()) > DB_POOL_MAX_AGE:
+            _async_born.pop(pid, None)
+            async_counters["recycled_age"] += 1
+            conn.terminate()
+        await async_pool.release(conn)
+
+
+def pool_stats() -> dict:
+    """Connection counts and checkout/recycle counters for both pools (used by /admin/metrics)."""
+    stats = {"sync": db_pool.stats()}
+    if _async_pool is not None:
+        size = _async_pool.get_size()
+        idle = _async_pool.get_idle_size()
+        stats["async"] = {
+            "in_use": size - idle, "idle": idle, "max": _async_pool.get_max_size(), **async_counters,
+        }
+    return stats
@@ -0,0 +1,65 @@
+"""
+Document version poll
+=====================
+Ingestion runs in another process (the pipeline or the Colab notebook) and
+can delete, rename and insert chunks of a live document in place (incremental
+updates). This process only learns about that by polling documents.updated_at
+every DOCUMENT_POLL_SECONDS. For every document that appeared, changed or
+disappeared since the last poll:
+
+  answer cache   entries whose context drew from it are dropped
+  BM25 index     reloaded / dropped (LEXICAL_BACKEND=bm25)
+
+Rerank cache entries are keyed on chunk text, so they can't serve results for
+changed content and need nothing here. The first poll only records versions.
+A BM25 index that failed to load at startup is retried on every poll.
+"""
+
+import os
+
+from app.db import fetch
+from app.cache import invalidate_document
+from app.bm25 import bm25_index, refresh_bm25_index, LEXICAL_BACKEND
+
+# BM25_REFRESH_SECONDS was the BM25-only refresh interval this poll replaced
+DOCUMENT_POLL_SECONDS = float(os.getenv("DOCUMENT_POLL_SECONDS", os.getenv("BM25_REFRESH_SECONDS", "30")))
+
+DOCUMENT_VERSIONS_SQL = "SELECT document_id::text, document_name, updated_at::text FROM documents"
+
+_versions: dict[str, tuple[str, str]] | None = None   # document_id → (document_name, updated_at)
+
+
+async def poll_document_versions() -> dict:
+    """
+    Diffs documents.updated_at against the last poll and invalidates what changed.
+    Versions are only committed once the BM25 reload succeeds, so a failed poll
+    is retried in full next time.
+    """
+    global _versions
+    rows = await fetch(DOCUMENT_VERSIONS_SQL)
+    current = {row[0]: (row[1], row[2]) for row in rows}
+    previous = current if _versions is None else _versions
+
+    added   = current.keys() - previous.keys()
+    removed = previous.keys() - current.keys()
+    changed = {doc_id for doc_id in current.keys() & previous.keys() if current[doc_id] != previous[doc_id]}
+
+    names = {current[doc_id][0] for doc_id in added | changed} | {previous[doc_id][0] for doc_id in removed | changed}
+    invalidated = sum(invalidate_document(name) for name in names)
+
+    if LEXICAL_BACKEND == "bm25" and (names or not bm25_index.ready):
+        await refresh_bm25_index()
+    _versions = current
+
+    if names:
+        print(
+            f"DEBUG document poll: {len(changed)} changed, {len(added)} added, {len(removed)} removed "
+            f"— {invalidated} cached answers dropped"
+        )
+    return {
+        "documents":           len(current),
+        "changed":             len(changed),
+        "added":               len(added),
+        "removed":             len(removed),
+        "answers_invalidated": invalidated,
+    }
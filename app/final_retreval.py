@@ -1,51 +1,140 @@
 import os
+import asyncio
+import hashlib
 import cohere
-from openai import OpenAI
 from dotenv import load_dotenv
 load_dotenv()
 
-from app.db import get_db_connection, release_db_connection
-from app.retrieval_core import retrieve_from_scored_chunks, embed_texts
+from app.db import fetch
+from app.retrieval_core import retrieve_from_scored_chunks, embed_texts, normalize_query
+from app.cache import TTLCache
+from app.vector_index import (
+    vector_candidates_sql, vector_query_args, to_vector_literal, shorten_embedding, EMBED_SHORT_DIMS, VECTOR_SHORTLIST,
+)
+from app.bm25 import bm25_index, LEXICAL_BACKEND
+from app.metrics import timed
 
 RRF_K         = 60
 RERANK_TOP_N  = 10
 RERANK_MODEL  = "rerank-v3.5"
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "sql")  # "sql" → fused in Postgres, "python" → reference path
 
-_cohere = cohere.Client(os.getenv("COHERE_API_KEY"))
-
-
-def retrieval_raw(query: str, limit: int = 20) -> list:
-    """Hybrid BM25 + vector search fused with RRF."""
-    query_emb = embed_texts([query.strip()])[0]
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT chunk_id, text, metadata,
-                   1 - (embedding <=> %s::vector) AS score
-            FROM document_chunks ORDER BY score DESC LIMIT %s
-        """, (query_emb, limit))
-        vector_rows = cur.fetchall()
-
-        cur.execute("""
-            SELECT chunk_id, text, metadata,
-                   ts_rank(ts, plainto_tsquery('english', %s)) AS score
-            FROM document_chunks
-            WHERE ts @@ plainto_tsquery('english', %s)
-            ORDER BY score DESC LIMIT %s
-        """, (query, query, limit))
-        bm25_rows = cur.fetchall()
-        cur.close()
-    finally:
-        release_db_connection(conn)
+RERANK_CACHE_SIZE  = int(os.getenv("RERANK_CACHE_SIZE", "2048"))
+RERANK_CACHE_TTL   = float(os.getenv("RERANK_CACHE_TTL", "86400"))
+# Skip Cohere when vector and lexical agree on the top chunk and its fused score leads
+# the runner-up by at least this fraction. 0 → always rerank. With RRF_K=60 the largest
+# possible margin is ~16%, so useful values sit around 0.02–0.10.
+RERANK_SKIP_MARGIN = float(os.getenv("RERANK_SKIP_MARGIN", "0"))
+# A skipped rerank has no cross-encoder score to hold against the thresholds in
+# retrieval_core, so its answer mode comes from the margin: "full" at or above
+# this, "partial" below it.
+RERANK_SKIP_FULL_MARGIN = float(os.getenv("RERANK_SKIP_FULL_MARGIN", "0.10"))
 
+_cohere = cohere.AsyncClient(os.getenv("COHERE_API_KEY"))
+
+# (normalized query, ordered candidate text hashes, model) → [(candidate index, relevance score)]
+# Keyed on content, not chunk_id: ids are positional, so after a re-ingest or
+# incremental update the same id can carry different text.
+_rerank_cache = TTLCache(max_entries=RERANK_CACHE_SIZE, ttl=RERANK_CACHE_TTL)
+rerank_counts = {"executed": 0, "cached": 0, "skipped": 0}
+
+def vector_sql(emb: str, limit: str, short_emb: str = "", shortlist: str = "") -> str:
+    return f"""
+    SELECT c.chunk_id, c.text, c.metadata, 1 - v.dist AS score
+    FROM ({vector_candidates_sql(emb, limit, short_emb, shortlist)}) v
+    JOIN document_chunks c ON c.id = v.id
+    ORDER BY v.dist
+"""
+
+
+def hybrid_sql(emb: str, query: str, limit: str, rrf_k: str, short_emb: str = "", shortlist: str = "") -> str:
+    """
+    Both candidate searches + RRF in one statement: one round trip, and only the
+    fused top-N rows (not 2 × limit texts/metadata) cross the wire. Placeholders
+    are passed in so the batch endpoint can run it per row of a LATERAL join.
+    Tie-break matches retrieval_raw's stable sort: vector order first, then lexical-only.
+    """
+    return f"""
+    SELECT c.chunk_id, c.text, c.metadata, f.score, f.vector_rank, f.lexical_rank
+    FROM (
+        SELECT COALESCE(vec.id, lex.id) AS id,
+               1.0 / ({rrf_k}::float8 + COALESCE(vec.rank, {limit} + 1)) +
+               1.0 / ({rrf_k}::float8 + COALESCE(lex.rank, {limit} + 1)) AS score,
+               vec.rank AS vector_rank,
+               lex.rank AS lexical_rank
+        FROM (
+            SELECT id, row_number() OVER (ORDER BY dist) AS rank
+            FROM ({vector_candidates_sql(emb, limit, short_emb, shortlist)}) v
+        ) vec
+        FULL OUTER JOIN (
+            SELECT id, row_number() OVER (ORDER BY score DESC) AS rank
+            FROM (
+                SELECT id, ts_rank(ts, plainto_tsquery('english', {query})) AS score
+                FROM document_chunks
+                WHERE ts @@ plainto_tsquery('english', {query})
+                ORDER BY score DESC LIMIT {limit}
+            ) l
+        ) lex ON vec.id = lex.id
+    ) f
+    JOIN document_chunks c ON c.id = f.id
+    ORDER BY f.score DESC, f.vector_rank NULLS LAST, f.lexical_rank
+    LIMIT {limit}
+"""
+
+
+def batch_sql(per_query: str, order_by: str, short_array: str) -> str:
+    """
+    Runs `per_query` (built with q.emb / q.query / q.short_emb placeholders)
+    once per question via LATERAL over the unnested arrays $1 (embeddings),
+    $2 (questions) and, in two-pass mode, `short_array` (short embeddings).
+    Rows come back tagged with the 1-based question position.
+    """
+    arrays, columns = "$1::text[], $2::text[]", "emb, query"
+    if EMBED_SHORT_DIMS:
+        arrays, columns = f"{arrays}, {short_array}::text[]", columns + ", short_emb"
+    return f"""
+    SELECT q.ord, h.*
+    FROM unnest({arrays}) WITH ORDINALITY AS q({columns}, ord)
+    CROSS JOIN LATERAL ({per_query}) h
+    ORDER BY q.ord, {order_by}
+"""
+
+
+VECTOR_SQL = vector_sql("$1", "$2", "$3", "$4")
+
+BM25_SQL = """
+    SELECT chunk_id, text, metadata,
+           ts_rank(ts, plainto_tsquery('english', $1)) AS score
+    FROM document_chunks
+    WHERE ts @@ plainto_tsquery('english', $1)
+    ORDER BY score DESC LIMIT $2
+"""
+
+HYBRID_SQL = hybrid_sql("$1", "$2", "$3", "$4", "$5", "$6")
+
+# One round trip for a whole /chat/batch — $1 embeddings[], $2 questions[], $3 limit, then
+#   hybrid: $4 RRF k, $5 short embeddings[], $6 shortlist
+#   vector: $4 short embeddings[], $5 shortlist
+# (the short-embedding parameters only in two-pass mode)
+BATCH_HYBRID_SQL = batch_sql(
+    hybrid_sql("q.emb", "q.query", "$3", "$4", "q.short_emb", "$6"),
+    "h.score DESC, h.vector_rank NULLS LAST, h.lexical_rank", "$5",
+)
+BATCH_VECTOR_SQL = batch_sql(vector_sql("q.emb", "$3", "q.short_emb", "$5"), "h.score DESC", "$4")
+
+
+def rrf_fuse(vector_rows: list, bm25_rows: list, limit: int) -> list:
+    """Reciprocal rank fusion of two ranked row lists → [(score, item)] best first."""
     vector_ranks = {row[0]: i + 1 for i, row in enumerate(vector_rows)}
     bm25_ranks   = {row[0]: i + 1 for i, row in enumerate(bm25_rows)}
 
     # Deduplicate and fuse
     all_chunks = {
-        row[0]: {"chunk_id": row[0], "text": row[1], "metadata": row[2]}
-        for row in vector_rows + bm25_rows
+        row[0]: {
+            "chunk_id": row[0], "text": row[1], "metadata": row[2],
+            "vector_rank": vector_ranks.get(row[0]), "lexical_rank": bm25_ranks.get(row[0]),
+        }
+        for row in list(vector_rows) + list(bm25_rows)
     }
 
     fused = sorted(
@@ -59,7 +148,116 @@ def retrieval_raw(query: str, limit: int = 20) -> list:
     return fused[:limit]
 
 
-def rerank_with_cohere(query: str, fused: list) -> list:
+async def retrieval_fused(query: str, limit: int = 20) -> list:
+    """Hybrid BM25 + vector search with RRF computed server-side in a single statement."""
+    query_emb = (await embed_texts([query.strip()]))[0]
+    with timed("hybrid_sql"):
+        rows = await fetch(HYBRID_SQL, to_vector_literal(query_emb), query, limit, RRF_K,
+                           *vector_query_args(query_emb))
+    return [
+        (row[3], {
+            "chunk_id": row[0], "text": row[1], "metadata": row[2],
+            "vector_rank": row[4], "lexical_rank": row[5],
+        })
+        for row in rows
+    ]
+
+
+async def retrieval_raw(query: str, limit: int = 20) -> list:
+    """Hybrid BM25 + vector search fused with RRF in Python — reference for retrieval_fused."""
+
+    async def vector_search():
+        query_emb = (await embed_texts([query.strip()]))[0]
+        with timed("vector_sql"):
+            return await fetch(VECTOR_SQL, to_vector_literal(query_emb), limit,
+                               *vector_query_args(query_emb))
+
+    async def lexical_search():
+        with timed("lexical_sql"):
+            return await fetch(BM25_SQL, query, limit)
+
+    # The lexical query doesn't need the embedding — run it while OpenAI embeds
+    vector_rows, bm25_rows = await asyncio.gather(vector_search(), lexical_search())
+    return rrf_fuse(vector_rows, bm25_rows, limit)
+
+
+async def retrieval_bm25(query: str, limit: int = 20) -> list:
+    """Vector search in Postgres + in-process BM25 (app.bm25), fused with RRF."""
+    query_emb = (await embed_texts([query.strip()]))[0]
+    with timed("vector_sql"):
+        vector_rows = await fetch(VECTOR_SQL, to_vector_literal(query_emb), limit,
+                                  *vector_query_args(query_emb))
+    with timed("bm25"):
+        bm25_rows = bm25_index.search(query, limit)
+    return rrf_fuse(vector_rows, bm25_rows, limit)
+
+
+async def hybrid_candidates(query: str, limit: int = 20) -> list:
+    """Fused candidates from the configured backend; tsvector is the fallback until BM25 is loaded."""
+    if LEXICAL_BACKEND == "bm25" and bm25_index.ready:
+        return await retrieval_bm25(query, limit)
+    if HYBRID_FUSION == "python":
+        return await retrieval_raw(query, limit)
+    return await retrieval_fused(query, limit)
+
+
+async def hybrid_candidates_batch(queries: list[str], limit: int = 20) -> list[list]:
+    """
+    Fused candidates for several questions: one embeddings request and one SQL
+    round trip for all of them. Returns one candidate list per query, in order.
+    """
+    queries = [q.strip() for q in queries]
+    embeddings = await embed_texts(queries)
+    literals = [to_vector_literal(emb) for emb in embeddings]
+    short = [to_vector_literal(shorten_embedding(emb)) for emb in embeddings] if EMBED_SHORT_DIMS else None
+    use_bm25 = LEXICAL_BACKEND == "bm25" and bm25_index.ready
+
+    if use_bm25:
+        args = (literals, queries, limit) + ((short, VECTOR_SHORTLIST) if short else ())
+        with timed("batch_sql"):
+            rows = await fetch(BATCH_VECTOR_SQL, *args)
+    else:
+        args = (literals, queries, limit, RRF_K) + ((short, VECTOR_SHORTLIST) if short else ())
+        with timed("batch_sql"):
+            rows = await fetch(BATCH_HYBRID_SQL, *args)
+
+    grouped: list[list] = [[] for _ in queries]
+    for row in rows:
+        grouped[row[0] - 1].append(tuple(row)[1:])
+
+    if use_bm25:
+        with timed("bm25"):
+            return [rrf_fuse(vector_rows, bm25_index.search(q, limit), limit)
+                    for q, vector_rows in zip(queries, grouped)]
+    return [
+        [
+            (row[3], {
+                "chunk_id": row[0], "text": row[1], "metadata": row[2],
+                "vector_rank": row[4], "lexical_rank": row[5],
+            })
+            for row in rows_for_query
+        ]
+        for rows_for_query in grouped
+    ]
+
+
+async def compare_fusion(query: str, limit: int = 20) -> dict:
+    """Runs both fusion paths for one query and reports where their rankings differ."""
+    sql_fused, py_fused = await asyncio.gather(
+        retrieval_fused(query, limit), retrieval_raw(query, limit)
+    )
+    sql_ids = [item["chunk_id"] for _, item in sql_fused]
+    py_ids  = [item["chunk_id"] for _, item in py_fused]
+    return {
+        "identical":   sql_ids == py_ids,
+        "sql":         sql_ids,
+        "python":      py_ids,
+        "only_sql":    sorted(set(sql_ids) - set(py_ids)),
+        "only_python": sorted(set(py_ids) - set(sql_ids)),
+    }
+
+
+async def rerank_with_cohere(query: str, fused: list) -> list:
     """
     Cross-encoder reranking on top of RRF results.
     Bi-encoder (vector search) encodes query and chunk separately — fast but
@@ -69,11 +267,12 @@ def rerank_with_cohere(query: str, fused: list) -> list:
     if not fused:
         return fused
 
-    response = _cohere.rerank(
-        model=RERANK_MODEL, query=query,
-        documents=[item["text"] for _, item in fused],
-        top_n=RERANK_TOP_N, return_documents=False,
-    )
+    with timed("rerank"):
+        response = await _cohere.rerank(
+            model=RERANK_MODEL, query=query,
+            documents=[item["text"] for _, item in fused],
+            top_n=RERANK_TOP_N, return_documents=False,
+        )
 
     reranked = [(r.relevance_score, fused[r.index][1]) for r in response.results]
 
@@ -82,17 +281,80 @@ def rerank_with_cohere(query: str, fused: list) -> list:
     return reranked
 
 
-def retrieve_sql(query: str) -> dict:
-    fused = retrieval_raw(query)
+def _text_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def decisive_margin(fused: list) -> float | None:
+    """
+    The top chunk's relative lead over the runner-up when both legs rank it first
+    and the lead is at least RERANK_SKIP_MARGIN; otherwise None (rerank needed).
+    """
+    if RERANK_SKIP_MARGIN <= 0 or len(fused) < 2:
+        return None
+    (top_score, top), (second_score, _) = fused[0], fused[1]
+    if top.get("vector_rank") != 1 or top.get("lexical_rank") != 1:
+        return None
+    margin = (top_score - second_score) / top_score
+    return margin if margin >= RERANK_SKIP_MARGIN else None
+
+
+async def rerank_candidates(query: str, fused: list) -> tuple[list, str, str | None]:
+    """
+    Reranks fused candidates, reusing cached Cohere results and skipping Cohere
+    entirely for decisive RRF results. Returns (reranked, "executed"|"cached"|"skipped",
+    answer mode for a skipped rerank — None when the scores decide it).
+    """
+    mode = None
+    margin = decisive_margin(fused)
+    if margin is not None:
+        # Scores relative to the top chunk, for ordering and sibling selection only;
+        # the mode comes from the margin, not from the rerank thresholds
+        top_score = fused[0][0]
+        status, reranked = "skipped", [(score / top_score, item) for score, item in fused[:RERANK_TOP_N]]
+        mode = "full" if margin >= RERANK_SKIP_FULL_MARGIN else "partial"
+    else:
+        key = (normalize_query(query), tuple(_text_hash(item["text"]) for _, item in fused), RERANK_MODEL)
+        order = _rerank_cache.get(key)
+        if order is not None:
+            status = "cached"
+        else:
+            status = "executed"
+            reranked = await rerank_with_cohere(query, fused)
+            position = {id(item): i for i, (_, item) in enumerate(fused)}
+            order = [(position[id(item)], score) for score, item in reranked]
+            _rerank_cache.put(key, order)
+        reranked = [(score, fused[i][1]) for i, score in order]
+
+    rerank_counts[status] += 1
+    print(f"DEBUG rerank: {status}" + (f" (margin {margin:.3f} → {mode})" if mode else ""))
+    return reranked, status, mode
+
+
+def rerank_stats() -> dict:
+    return {**rerank_counts, "cache": _rerank_cache.stats()}
+
+
+async def retrieve_sql(query: str, fused: list | None = None) -> dict:
+    """Rerank + threshold scoring. Pass `fused` to reuse candidates fetched earlier (speculative retrieval)."""
+    if fused is None:
+        fused = await hybrid_candidates(query)
     if not fused:
         print("DEBUG: No chunks found")
         return {"mode": "none", "top_score": 0, "results": [], "sources": []}
 
-    reranked = rerank_with_cohere(query, fused)
+    reranked, rerank_status, mode = await rerank_candidates(query, fused)
     print(f"DEBUG query: {query}")
     print(f"DEBUG top score: {reranked[0][0]:.4f} | chunk: {reranked[0][1]['text'][:80]}...")
-    return retrieve_from_scored_chunks(reranked)
+    result = retrieve_from_scored_chunks(reranked, mode)
+    result["rerank"] = rerank_status
+    return result
 
 
 if __name__ == "__main__":
-    result = retrieve_sql(input("\nAsk a question\n> "))
\ No newline at end of file
+    import sys
+    question = input("\nAsk a question\n> ")
+    if "--compare" in sys.argv:
+        print(asyncio.run(compare_fusion(question)))
+    else:
+        result = asyncio.run(retrieve_sql(question))
\ No newline at end of file
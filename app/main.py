@@ -1,21 +1,76 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-import uuid, json
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+import os, uuid, time, asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response, Query
+from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
-from openai import OpenAI
+from openai import AsyncOpenAI
 
-from app.final_retreval import retrieve_sql
-from app.retrieval_core import answer_query, stream_answer_query
-from app.query_rewrite import rewrite_follow_up
+from app.final_retreval import retrieve_sql, hybrid_candidates, hybrid_candidates_batch
+from app.retrieval_core import answer_query, stream_answer_query, normalize_query
+from app.query_rewrite import rewrite_follow_up, needs_rewrite, same_question
 from app.admin_router import router as admin_router   # ← new
+from app.cache import answer_cache
+from app.db import get_async_pool, close_async_pool, PoolTimeout
+from app.bm25 import refresh_bm25_index, LEXICAL_BACKEND
+from app.document_versions import poll_document_versions, DOCUMENT_POLL_SECONDS
+from app.conversation_store import conversation_store, CONVERSATION_SWEEP_SECONDS
+from app.metrics import timed, observe, start_request, server_timing, timings_ms
+from app.sse import sse_event, with_keepalive, coalesce, STREAM_COALESCE_MS, STREAM_MAX_FRAME_BYTES
 
-app = FastAPI()
-client = OpenAI()
+BATCH_MAX_QUESTIONS  = int(os.getenv("BATCH_MAX_QUESTIONS", "25"))
+BATCH_CONCURRENCY    = int(os.getenv("BATCH_CONCURRENCY", "4"))  # parallel rerank + generation per batch
+
+
+async def _poll_documents_periodically():
+    # Ingestion runs outside this process — drop cached answers and reload BM25
+    # for documents it added, updated in place or deleted
+    while True:
+        await asyncio.sleep(DOCUMENT_POLL_SECONDS)
+        try:
+            await poll_document_versions()
+        except Exception as e:
+            print(f"WARN document poll failed: {e}")
+
+
+async def _sweep_conversations_periodically():
+    while True:
+        await asyncio.sleep(CONVERSATION_SWEEP_SECONDS)
+        try:
+            await conversation_store.sweep()
+        except Exception as e:
+            print(f"WARN conversation sweep failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await get_async_pool()
+    await conversation_store.setup()
+    background = [
+        asyncio.create_task(_sweep_conversations_periodically()),
+        asyncio.create_task(_poll_documents_periodically()),
+    ]
+    if LEXICAL_BACKEND == "bm25":
+        try:
+            print(f"BM25 index loaded: {await refresh_bm25_index()}")
+        except Exception as e:
+            print(f"WARN bm25 index unavailable, using tsvector: {e}")
+    try:
+        await poll_document_versions()  # baseline versions
+    except Exception as e:
+        print(f"WARN document poll failed: {e}")
+    yield
+    for task in background:
+        task.cancel()
+    await close_async_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+client = AsyncOpenAI()
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,8 +80,11 @@ app.add_middleware(
 
 app.include_router(admin_router)   # ← new
 
-# In-memory conversation store — resets on restart (fine for now)
-conversation_store: dict[str, dict] = {}
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request, exc: PoolTimeout):
+    # Every connection is busy — shed load instead of opening more
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 
 class ChatRequest(BaseModel):
@@ -39,73 +97,238 @@ class Source(BaseModel):
 class ChatResponse(BaseModel):
     reply: str; conversation_id: str; sources: list[Source] = []
 
+class BatchRequest(BaseModel):
+    questions: list[str] = Field(min_length=1, max_length=BATCH_MAX_QUESTIONS)
+
+class BatchAnswer(BaseModel):
+    question: str; reply: str; sources: list[Source] = []
+
+class BatchResponse(BaseModel):
+    results: list[BatchAnswer]
+
 
-def resolve_query(req: ChatRequest) -> tuple[str, str]:
-    """Resolves conversation_id and rewrites follow-up queries into standalone ones."""
+async def resolve_query(req: ChatRequest) -> tuple[str, str, asyncio.Task | None]:
+    """
+    Resolves conversation_id and rewrites follow-up queries into standalone ones.
+    Follow-ups that already name their topic skip the rewrite. Otherwise retrieval
+    for the raw message starts alongside the rewrite and is handed back as a task
+    if the rewrite comes back effectively unchanged.
+    """
     cid = req.conversation_id or str(uuid.uuid4())
-    state = conversation_store.get(cid)
-    if state and "last_query" in state:
-        query = rewrite_follow_up(client, state["last_query"], req.message)
-    else:
-        query = req.message.strip()
-    return cid, query
+    state = await conversation_store.get(cid)
+    message = req.message.strip()
+    if not (state and "last_query" in state) or not message or not needs_rewrite(message):
+        return cid, message, None
 
+    speculative = asyncio.create_task(hybrid_candidates(message))
+    speculative.add_done_callback(lambda t: t.cancelled() or t.exception())  # never leave errors unretrieved
+    with timed("rewrite"):
+        query = await rewrite_follow_up(client, state["last_query"], req.message)
+    if same_question(query, message):
+        return cid, message, speculative
+    speculative.cancel()
+    return cid, query, None
 
-def _retrieval_or_error(query: str) -> dict | None:
-    result = retrieve_sql(query)
+
+async def _retrieval_or_error(query: str, speculative: asyncio.Task | None = None) -> dict | None:
+    fused = None
+    if speculative is not None:
+        try:
+            fused = await speculative
+        except Exception:
+            fused = None  # retry non-speculatively
+    result = await retrieve_sql(query, fused)
     if not isinstance(result, dict) or "mode" not in result:
         return None
     return result
 
 
+def _cache_answer(query: str, reply: str, retrieval: dict) -> None:
+    if retrieval["mode"] == "none":
+        # "No information" names no document that could answer it, so nothing would
+        # invalidate it when the answering PDF is ingested — and it costs no LLM call
+        return
+    answer_cache.put(normalize_query(query), {
+        "reply":     reply,
+        "sources":   retrieval.get("sources", []),
+        "mode":      retrieval["mode"],
+        # Every document the context drew from — used for admin invalidation
+        "documents": frozenset(item["metadata"].get("document") for _, item in retrieval["results"]),
+    })
+
+
 @app.get("/")
 def health_check():
     return {"status": "backend is running"}
 
 
 @app.post("/chat")
-def chat(req: ChatRequest):
-    cid, query = resolve_query(req)
+async def chat(req: ChatRequest, response: Response):
+    timings = start_request()
+    try:
+        with timed("total"):
+            return await _chat(req)
+    finally:
+        response.headers["Server-Timing"] = server_timing(timings)
+
+
+async def _chat(req: ChatRequest) -> ChatResponse:
+    cid, query, speculative = await resolve_query(req)
 
     if not query:
         return ChatResponse(reply="Please ask a relevant question.", conversation_id=cid)
 
-    retrieval = _retrieval_or_error(query)
+    cached = answer_cache.get(normalize_query(query))
+    if cached:
+        if speculative:
+            speculative.cancel()
+        await conversation_store.put(cid, {"last_query": query, "last_answer": cached["reply"]})
+        return ChatResponse(reply=cached["reply"], conversation_id=cid, sources=cached["sources"])
+
+    retrieval = await _retrieval_or_error(query, speculative)
     if not retrieval:
         return ChatResponse(reply="An internal error occurred.", conversation_id=cid)
 
-    reply = answer_query(query, retrieval)
-    conversation_store[cid] = {"last_query": query, "last_answer": reply}
+    reply = await answer_query(query, retrieval)
+    await conversation_store.put(cid, {"last_query": query, "last_answer": reply})
+    _cache_answer(query, reply, retrieval)
     return ChatResponse(reply=reply, conversation_id=cid, sources=retrieval.get("sources", []))
 
 
 @app.post("/chat/stream")
-async def chat_stream(req: ChatRequest):
-    cid, query = resolve_query(req)
+async def chat_stream(
+    req: ChatRequest,
+    coalesce_ms: int = Query(STREAM_COALESCE_MS, ge=0, le=2000),
+    max_frame_bytes: int = Query(STREAM_MAX_FRAME_BYTES, ge=0, le=65536),
+):
+    """
+    SSE answer stream. coalesce_ms / max_frame_bytes let the client trade
+    per-token latency for fewer frames; the defaults keep one token per event.
+    """
+    timings = start_request()
+    started = time.perf_counter()
+    cid, query, speculative = await resolve_query(req)
 
-    def generate():
-        yield f"event: meta\ndata: {json.dumps({'conversation_id': cid})}\n\n"
+    def timing_event() -> str:
+        observe("total", time.perf_counter() - started)
+        return sse_event("timing", {"stages_ms": timings_ms(timings)})
+
+    async def generate():
+        yield sse_event("meta", {"conversation_id": cid})
 
         if not query:
-            yield f"event: error\ndata: {json.dumps({'message': 'Please ask a relevant question.'})}\n\n"
+            yield sse_event("error", {"message": "Please ask a relevant question."})
+            return
+
+        cached = answer_cache.get(normalize_query(query))
+        if cached:
+            # Replay without touching retrieval, Cohere or OpenAI
+            if speculative:
+                speculative.cancel()
+            yield sse_event("token", {"token": cached["reply"]})
+            yield sse_event("sources", {"sources": cached["sources"]})
+            yield timing_event()
+            yield sse_event("done", {})
+            await conversation_store.put(cid, {"last_query": query, "last_answer": cached["reply"]})
             return
 
-        retrieval = _retrieval_or_error(query)
+        # Keep the connection warm while embedding, SQL and rerank run
+        retrieval_task = asyncio.ensure_future(_retrieval_or_error(query, speculative))
+        async for comment in with_keepalive(retrieval_task):
+            yield comment
+        try:
+            retrieval = retrieval_task.result()
+        except PoolTimeout as e:
+            # Headers are already sent, so the 503 handler can't apply — report it in-band
+            print(f"WARN stream retrieval shed: {e}")
+            yield sse_event("error", {"message": "The server is busy, please retry shortly.", "retry_after": 1})
+            return
+        except Exception as e:
+            print(f"WARN stream retrieval failed: {type(e).__name__}: {e}")
+            retrieval = None
         if not retrieval:
-            yield f"event: error\ndata: {json.dumps({'message': 'An internal error occurred.'})}\n\n"
+            yield sse_event("error", {"message": "An internal error occurred."})
             return
 
-        full_reply = ""
-        for token in stream_answer_query(query, retrieval):
-            full_reply += token
-            yield f"event: token\ndata: {json.dumps({'token': token})}\n\n"
+        reply_parts: list[str] = []
+        tokens = stream_answer_query(query, retrieval)
+        async for frame in coalesce(tokens, coalesce_ms, max_frame_bytes):
+            reply_parts.append(frame)
+            yield sse_event("token", {"token": frame})
+        full_reply = "".join(reply_parts)
 
-        yield f"event: sources\ndata: {json.dumps({'sources': retrieval.get('sources', [])})}\n\n"
-        yield f"event: done\ndata: {{}}\n\n"
+        yield sse_event("sources", {"sources": retrieval.get("sources", [])})
+        yield timing_event()
+        yield sse_event("done", {})
 
-        conversation_store[cid] = {"last_query": query, "last_answer": full_reply}
+        await conversation_store.put(cid, {"last_query": query, "last_answer": full_reply})
+        _cache_answer(query, full_reply, retrieval)
 
     return StreamingResponse(generate(), media_type="text/event-stream", headers={
         "Cache-Control": "no-cache",
         "X-Accel-Buffering": "no",
-    })
\ No newline at end of file
+    })
+
+
+@app.post("/chat/batch")
+async def chat_batch(req: BatchRequest, response: Response):
+    """
+    Answers several standalone questions (no conversation state). Uncached
+    questions share one embeddings request and one SQL round trip; rerank and
+    generation then fan out with at most BATCH_CONCURRENCY in flight.
+    Results come back in request order.
+    """
+    timings = start_request()
+    try:
+        with timed("total"):
+            return await _chat_batch(req)
+    finally:
+        response.headers["Server-Timing"] = server_timing(timings)
+
+
+async def _chat_batch(req: BatchRequest) -> BatchResponse:
+    questions = [q.strip() for q in req.questions]
+
+    # Deduplicate by normalized text; answered ones come straight from the cache
+    answers: dict[str, dict] = {}
+    pending: dict[str, str] = {}
+    for question in questions:
+        key = normalize_query(question)
+        if not key or key in answers or key in pending:
+            continue
+        cached = answer_cache.get(key)
+        if cached:
+            answers[key] = {"reply": cached["reply"], "sources": cached["sources"]}
+        else:
+            pending[key] = question
+
+    if pending:
+        try:
+            candidates = await hybrid_candidates_batch(list(pending.values()))
+        except Exception as e:
+            print(f"WARN batch retrieval failed: {e}")
+            candidates = [None] * len(pending)  # fall back to per-question retrieval
+
+        limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def answer_one(question: str, fused: list | None) -> dict:
+            async with limit:
+                try:
+                    retrieval = await retrieve_sql(question, fused)  # fused=None → retrieves on its own
+                    reply = await answer_query(question, retrieval)
+                except Exception as e:
+                    print(f"WARN batch question failed: {e}")
+                    return {"reply": "An internal error occurred.", "sources": []}
+            _cache_answer(question, reply, retrieval)
+            return {"reply": reply, "sources": retrieval.get("sources", [])}
+
+        results = await asyncio.gather(*(
+            answer_one(question, fused) for question, fused in zip(pending.values(), candidates)
+        ))
+        answers.update(zip(pending, results))
+
+    empty = {"reply": "Please ask a relevant question.", "sources": []}
+    return BatchResponse(results=[
+        BatchAnswer(question=question, **answers.get(normalize_query(question), empty))
+        for question in questions
+    ])
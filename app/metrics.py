@@ -0,0 +1,155 @@
+"""
+Per-stage latency metrics
+=========================
+    with timed("embed"):
+        ...
+
+records the stage into a process-wide histogram (Prometheus buckets plus a
+sliding window for p50/p95/p99) and into the current request's timings,
+which /chat returns as a Server-Timing header and /chat/stream as a
+`timing` event. Request timings ride on a contextvar, so tasks spawned
+during the request (speculative retrieval) report into the same request.
+
+observe_tokens("prompt", n) records prompt sizes the same way, in token
+buckets, so generation cost shows up next to the stage latencies.
+
+Rendered in Prometheus text format by GET /admin/metrics.
+"""
+
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+BUCKETS         = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES       = (0.5, 0.95, 0.99)
+TOKEN_BUCKETS   = (250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+QUANTILE_WINDOW = 2048  # most recent observations per stage used for quantiles
+
+
+class StageHistogram:
+    def __init__(self, bounds: tuple = BUCKETS):
+        self.bounds  = bounds
+        self.buckets = [0] * len(bounds)
+        self.count   = 0
+        self.sum     = 0.0
+        self.recent  = deque(maxlen=QUANTILE_WINDOW)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+        for i, bound in enumerate(self.bounds):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+_stages: dict[str, StageHistogram] = {}
+_tokens: dict[str, StageHistogram] = {}
+_lock = threading.Lock()
+_request_timings: contextvars.ContextVar[dict | None] = contextvars.ContextVar("request_timings", default=None)
+
+
+def observe(stage: str, seconds: float):
+    with _lock:
+        hist = _stages.get(stage)
+        if hist is None:
+            hist = _stages[stage] = StageHistogram()
+        hist.observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def observe_tokens(kind: str, tokens: int):
+    with _lock:
+        hist = _tokens.get(kind)
+        if hist is None:
+            hist = _tokens[kind] = StageHistogram(TOKEN_BUCKETS)
+        hist.observe(tokens)
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def start_request() -> dict:
+    """Starts collecting stage timings for the current request. Returns the (live) dict."""
+    timings: dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def timings_ms(timings: dict) -> dict:
+    return {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+
+
+def server_timing(timings: dict) -> str:
+    return ", ".join(f"{stage};dur={ms}" for stage, ms in timings_ms(timings).items())
+
+
+# ── Prometheus text format ────────────────────────────────────────────────────
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def render_prometheus(extra: list[tuple[str, str, str, list[tuple[dict, float]]]] = ()) -> str:
+    """
+    Stage histograms + quantile summaries, followed by `extra` metric families
+    given as (name, type, help, [(labels, value), ...]).
+    """
+    lines = [
+        "# HELP nova_stage_duration_seconds Query pipeline stage latency.",
+        "# TYPE nova_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        stages = sorted(_stages.items())
+        for stage, hist in stages:
+            for bound, count in zip(BUCKETS, hist.buckets):
+                lines.append(f'nova_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'nova_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {hist.count}')
+            lines.append(f'nova_stage_duration_seconds_sum{{stage="{stage}"}} {hist.sum:.6f}')
+            lines.append(f'nova_stage_duration_seconds_count{{stage="{stage}"}} {hist.count}')
+
+        lines += [
+            f"# HELP nova_stage_latency_seconds Query pipeline stage latency over the last {QUANTILE_WINDOW} requests.",
+            "# TYPE nova_stage_latency_seconds summary",
+        ]
+        for stage, hist in stages:
+            for q in QUANTILES:
+                lines.append(f'nova_stage_latency_seconds{{stage="{stage}",quantile="{q}"}} {hist.quantile(q):.6f}')
+            lines.append(f'nova_stage_latency_seconds_sum{{stage="{stage}"}} {hist.sum:.6f}')
+            lines.append(f'nova_stage_latency_seconds_count{{stage="{stage}"}} {hist.count}')
+
+        lines += [
+            "# HELP nova_llm_tokens Tokens sent to the LLM per request (prompt total and the context part).",
+            "# TYPE nova_llm_tokens histogram",
+        ]
+        for kind, hist in sorted(_tokens.items()):
+            for bound, count in zip(hist.bounds, hist.buckets):
+                lines.append(f'nova_llm_tokens_bucket{{kind="{kind}",le="{bound}"}} {count}')
+            lines.append(f'nova_llm_tokens_bucket{{kind="{kind}",le="+Inf"}} {hist.count}')
+            lines.append(f'nova_llm_tokens_sum{{kind="{kind}"}} {hist.sum:.0f}')
+            lines.append(f'nova_llm_tokens_count{{kind="{kind}"}} {hist.count}')
+
+    for name, kind, help_text, samples in extra:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,6 +1,56 @@
-from openai import OpenAI
-client=OpenAI()
-def rewrite_follow_up(client,prev_query:str,follow_up:str)-> str:
+import os
+import re
+from openai import AsyncOpenAI
+
+from app.cache import TTLCache
+from app.retrieval_core import normalize_query
+
+REWRITE_MODE       = os.getenv("REWRITE_MODE", "auto")  # "auto" → heuristic gate, "always" → rewrite every follow-up
+REWRITE_CACHE_SIZE = int(os.getenv("REWRITE_CACHE_SIZE", "2048"))
+REWRITE_CACHE_TTL  = float(os.getenv("REWRITE_CACHE_TTL", "86400"))
+
+# Words that point back at the previous turn — their presence means the follow-up isn't standalone
+REFERRING_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "theirs",
+    "he", "she", "his", "her", "same", "above", "former", "latter", "there",
+}
+# Words that carry no topic on their own ("what about ...", "and for ...?")
+FILLER_WORDS = {
+    "what", "whats", "about", "how", "and", "also", "then", "for", "the", "a", "an", "is", "are",
+    "was", "of", "in", "on", "to", "do", "does", "can", "could", "i", "me", "tell", "more",
+    "please", "any", "which", "who", "when", "where", "why", "else", "too", "again", "ok", "okay",
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+client=AsyncOpenAI()
+_rewrite_cache = TTLCache(max_entries=REWRITE_CACHE_SIZE, ttl=REWRITE_CACHE_TTL)
+
+
+def needs_rewrite(follow_up: str) -> bool:
+    """
+    Cheap local gate for the rewrite LLM call. "what about hostel fees?" names
+    its own topic and goes straight to retrieval; "is it mandatory?" or
+    "and for mtech?" lean on the previous question and get rewritten.
+    """
+    if REWRITE_MODE == "always":
+        return True
+    words = _WORD_RE.findall(follow_up.lower())
+    if any(w in REFERRING_WORDS for w in words):
+        return True
+    return len([w for w in words if w not in FILLER_WORDS]) < 2
+
+
+def same_question(a: str, b: str) -> bool:
+    """True when two questions differ only in case, spacing or punctuation."""
+    return _WORD_RE.findall(a.lower()) == _WORD_RE.findall(b.lower())
+
+
+async def rewrite_follow_up(client,prev_query:str,follow_up:str)-> str:
+    key = (normalize_query(prev_query), normalize_query(follow_up))
+    cached = _rewrite_cache.get(key)
+    if cached is not None:
+        return cached
     prompt =f"""You are given a previous user question and a follow-up question.
 Rewrite the follow-up into a standalone question that preserves the original intent.
 Previous question:
@@ -10,7 +60,7 @@ Follow-up question
 Output ONLY the rewritten standalone question.
 Do not answer the question.
 """
-    response=client.chat.completions.create (
+    response=await client.chat.completions.create (
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You rewrite follow-up questions into standalone questions."},
@@ -18,4 +68,10 @@ Do not answer the question.
         ],
         temperature=0.0
         )
-    return response.choices[0].message.content.strip()
\ No newline at end of file
+    rewritten = response.choices[0].message.content.strip()
+    _rewrite_cache.put(key, rewritten)
+    return rewritten
+
+
+def rewrite_cache_stats() -> dict:
+    return _rewrite_cache.stats()
@@ -1,5 +1,13 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
+from array import array
+from functools import lru_cache
+import os
 import re
+import time
+import tiktoken
+
+from app.cache import TTLCache
+from app.metrics import timed, observe, observe_tokens
 
 PRIMARY_THRESHOLD   = 0.4   # score >= this → full answer
 SECONDARY_THRESHOLD = 0.35  # score >= this → partial answer, else out of scope
@@ -7,7 +15,23 @@ MAX_CONTEXT_CHUNKS  = 4
 MAX_SOURCES         = 2
 TOP_K               = 5
 
-_client = OpenAI()  # module-level singleton — avoids per-call connection pool churn
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+MIN_TRIMMED_TOKENS  = 64    # a trimmed prose chunk shorter than this isn't worth sending
+
+EMBED_MODEL         = "text-embedding-3-large"
+EMBED_CACHE_SIZE    = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_TTL     = float(os.getenv("EMBED_CACHE_TTL", "86400"))
+EMBED_CACHE_MAX_MB  = float(os.getenv("EMBED_CACHE_MAX_MB", "64"))
+
+_client = AsyncOpenAI()  # module-level singleton — avoids per-call connection pool churn
+
+# Query embeddings stored as float32 arrays: 3072 dims → 12 KB instead of ~100 KB of Python floats
+_embedding_cache = TTLCache(
+    max_entries=EMBED_CACHE_SIZE,
+    ttl=EMBED_CACHE_TTL,
+    max_bytes=int(EMBED_CACHE_MAX_MB * 1024 * 1024),
+    sizeof=lambda vec: vec.itemsize * len(vec),
+)
 
 SYSTEM_PROMPT = """You are a helpful assistant for university queries.
 
@@ -22,6 +46,8 @@ Guidelines:
 6. If context contains HTML tags like <br>, ignore them and treat the content as plain text.
 7. If table column headers appear fragmented or split across cells, reconstruct them logically before presenting.
 8. When the context contains a markdown table, ALWAYS reproduce it as a table. Never convert tabular data into bullet points or prose. """
+
+_TABLE_RE = re.compile(r"\|\s*[-:]+\s*\|")
 # ── Utilities ─────────────────────────────────────────────────────────────────
 
 def get_section_key(chunk_id: str) -> str:
@@ -38,8 +64,54 @@ def clean_section(section: str) -> str:
 def clean_document(doc: str) -> str:
     return doc.replace("_", " ").replace("-", " ").strip()
 
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """gpt-4o-mini's tokenizer, loaded on first use (tiktoken downloads the BPE file); None if unavailable."""
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"WARN tiktoken o200k_base unavailable, estimating tokens as chars/4: {e}")
+        return None
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+def is_table_chunk(text: str) -> bool:
+    return "|---" in text or _TABLE_RE.search(text) is not None
+
+def budget_context(chunks: list, budget: int = CONTEXT_TOKEN_BUDGET) -> tuple[str, int]:
+    """
+    Fills `budget` tokens with chunks in score order, so low-scoring chunks are
+    trimmed or dropped first. Prose that overflows is cut to the tokens left;
+    tables go in whole or not at all. Kept chunks stay in their original order.
+    Returns (context, context tokens).
+    """
+    order = sorted(range(len(chunks)), key=lambda i: chunks[i][0], reverse=True)
+    kept, remaining = {}, budget
+    for i in order:
+        _, item = chunks[i]
+        block = f"[{item['chunk_id']}]\n {item['text']}"
+        tokens = count_tokens(block) + 1  # + the "\n\n" separator
+        if tokens <= remaining:
+            kept[i] = block
+            remaining -= tokens
+        elif remaining >= MIN_TRIMMED_TOKENS and not is_table_chunk(item["text"]):
+            kept[i] = truncate_tokens(block, remaining - 1)
+            remaining = 0
+    return "\n\n".join(kept[i] for i in sorted(kept)), budget - remaining
+
 def build_context(chunks: list) -> str:
-    return "\n\n".join(f"[{item['chunk_id']}]\n {item['text']}" for _, item in chunks)
+    return budget_context(chunks)[0]
 
 def extract_sources(chunks: list) -> list[dict]:
     seen, sources = set(), []
@@ -54,53 +126,94 @@ def extract_sources(chunks: list) -> list[dict]:
             break
     return sources
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
-    response = _client.embeddings.create(model="text-embedding-3-large", input=texts)
-    return [item.embedding for item in response.data]
+def normalize_query(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+async def embed_texts(texts: list[str]) -> list[list[float]]:
+    """Embeds texts, serving repeats from the LRU+TTL cache and sending only misses to OpenAI."""
+    keys    = [(EMBED_MODEL, normalize_query(t)) for t in texts]
+    vectors = {key: _embedding_cache.get(key) for key in dict.fromkeys(keys)}
+    missing = [key for key, vec in vectors.items() if vec is None]
+
+    if missing:
+        # Embed the first original spelling seen for each missing key
+        originals = {}
+        for key, text in zip(keys, texts):
+            originals.setdefault(key, text.strip())
+        with timed("embed"):
+            response = await _client.embeddings.create(model=EMBED_MODEL, input=[originals[k] for k in missing])
+        for key, item in zip(missing, response.data):
+            vec = array("f", item.embedding)
+            _embedding_cache.put(key, vec)
+            vectors[key] = vec
+
+    return [vectors[key].tolist() for key in keys]
+
+def embedding_cache_stats() -> dict:
+    return _embedding_cache.stats()
 
 
 # ── Answer generation ─────────────────────────────────────────────────────────
 
 def _messages(query: str, retrieval: dict) -> list[dict]:
+    """Builds the prompt and records its size in retrieval["prompt_tokens"]."""
+    context, context_tokens = budget_context(retrieval["results"])
+    question = f"Question:\n{query}\n\nContext:\n"
+    # + 3 tokens of chat framing per message and 3 for the reply primer
+    retrieval["prompt_tokens"] = count_tokens(SYSTEM_PROMPT) + count_tokens(question) + context_tokens + 9
+    observe_tokens("prompt", retrieval["prompt_tokens"])
+    observe_tokens("context", context_tokens)
     return [
         {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user",   "content": f"Question:\n{query}\n\nContext:\n{build_context(retrieval['results'])}"},
+        {"role": "user",   "content": question + context},
     ]
 
-def answer_query(query: str, retrieval: dict) -> str:
+async def answer_query(query: str, retrieval: dict) -> str:
     if retrieval["mode"] == "none":
         return "The document does not clearly specify this."
-    response = _client.chat.completions.create(
-        model="gpt-4o-mini", messages=_messages(query, retrieval), temperature=0
-    )
+    messages = _messages(query, retrieval)
+    with timed("llm_total"):
+        response = await _client.chat.completions.create(
+            model="gpt-4o-mini", messages=messages, temperature=0
+        )
     return response.choices[0].message.content.strip()
 
-def stream_answer_query(query: str, retrieval: dict):
+async def stream_answer_query(query: str, retrieval: dict):
     """Yields string tokens from OpenAI stream."""
     if retrieval["mode"] == "none":
         yield "The document does not clearly specify this."
         return
-    stream = _client.chat.completions.create(
-        model="gpt-4o-mini", messages=_messages(query, retrieval), temperature=0, stream=True
+    messages = _messages(query, retrieval)
+    started = time.perf_counter()
+    first_token = None
+    stream = await _client.chat.completions.create(
+        model="gpt-4o-mini", messages=messages, temperature=0, stream=True
     )
-    for chunk in stream:
+    async for chunk in stream:
         delta = chunk.choices[0].delta
         if delta and delta.content:
+            if first_token is None:
+                first_token = time.perf_counter()
+                observe("llm_ttft", first_token - started)
             yield delta.content
+    observe("llm_total", time.perf_counter() - started)
 
 
 # ── Retrieval scoring ─────────────────────────────────────────────────────────
 
-def retrieve_from_scored_chunks(scored: list) -> dict:
+def retrieve_from_scored_chunks(scored: list, mode: str | None = None) -> dict:
+    """Picks the answer mode from the top score, unless the caller already decided it (`mode`)."""
     if not scored:
         return {"mode": "none", "top_score": 0, "results": [], "sources": []}
 
     top_score, top_item = scored[0]
+    if mode is None:
+        mode = "none" if top_score < SECONDARY_THRESHOLD else "partial" if top_score < PRIMARY_THRESHOLD else "full"
 
-    if top_score < SECONDARY_THRESHOLD:
+    if mode == "none":
         return {"mode": "none",    "top_score": top_score, "results": scored[:TOP_K], "sources": []}
 
-    if top_score < PRIMARY_THRESHOLD:
+    if mode == "partial":
         results = scored[:TOP_K]
         return {"mode": "partial", "top_score": top_score, "results": results, "sources": extract_sources(results)}
 
@@ -0,0 +1,101 @@
+"""
+Server-Sent Events helpers for /chat/stream
+===========================================
+Frames stay in the original shape — `event: token` with {"token": "..."} —
+but a frame may carry several deltas joined together. Clients that append
+tokens as they arrive work unchanged.
+
+Granularity is negotiated per request:
+    coalesce_ms      flush a frame at most this long after its first delta (0 → one delta per frame)
+    max_frame_bytes  flush early once a frame's text reaches this many bytes (0 → no size cap)
+"""
+
+import os
+import json
+import time
+import asyncio
+
+STREAM_COALESCE_MS       = int(os.getenv("STREAM_COALESCE_MS", "0"))      # server default: per-delta frames
+STREAM_MAX_FRAME_BYTES   = int(os.getenv("STREAM_MAX_FRAME_BYTES", "0"))
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", "10"))
+
+KEEPALIVE = ": keep-alive\n\n"
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def with_keepalive(task: asyncio.Future, interval: float = STREAM_KEEPALIVE_SECONDS):
+    """
+    Yields SSE comment frames every `interval` seconds until `task` finishes,
+    so proxies and mobile clients don't drop an idle connection during
+    retrieval. Cancels the task if the stream is closed first.
+    """
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=interval)
+            if done:
+                return
+            yield KEEPALIVE
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def coalesce(tokens, window_ms: int = 0, max_bytes: int = 0):
+    """
+    Regroups an async iterator of text deltas into frames of joined text.
+    A frame is flushed when the window since its first delta elapses (even if
+    the model stalls), when it reaches max_bytes, or when the stream ends.
+    With both limits at 0 every delta is its own frame.
+    """
+    if window_ms <= 0 and max_bytes <= 0:
+        async for token in tokens:
+            yield token
+        return
+
+    # A pump task feeds a queue so a stalled stream can't hold a frame past its window
+    queue: asyncio.Queue = asyncio.Queue()
+    end = object()
+
+    async def pump():
+        try:
+            async for token in tokens:
+                await queue.put(token)
+        except Exception as e:
+            await queue.put(e)
+        await queue.put(end)
+
+    pump_task = asyncio.create_task(pump())
+    window = window_ms / 1000 if window_ms > 0 else None
+    parts: list[str] = []
+    size = 0
+    deadline = None
+    try:
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield "".join(parts)
+                parts, size, deadline = [], 0, None
+                continue
+
+            if item is end:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            if not parts and window is not None:
+                deadline = time.monotonic() + window
+            parts.append(item)
+            size += len(item.encode())
+            if max_bytes > 0 and size >= max_bytes:
+                yield "".join(parts)
+                parts, size, deadline = [], 0, None
+
+        if parts:
+            yield "".join(parts)
+    finally:
+        pump_task.cancel()
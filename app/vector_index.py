@@ -0,0 +1,274 @@
+"""
+Vector index lifecycle
+======================
+pgvector's HNSW index is capped at 2000 dims for `vector`, so our 3072-dim
+text-embedding-3-large column can't be indexed directly. `halfvec` goes up
+to 4000 dims, so we index the expression `embedding::halfvec(3072)` and
+order by the same expression at query time (VECTOR_INDEX=hnsw).
+
+With EMBED_SHORT_DIMS set (e.g. 256/512/1024), search runs in two passes:
+a first pass over the reduced-dimension `embedding_short` column (the
+model is Matryoshka-trained, so truncating + renormalizing is equivalent
+to asking for fewer `dimensions`), then exact re-scoring of the shortlist
+with the full 3072-dim vectors. The index is then built on embedding_short.
+An HNSW scan yields at most hnsw.ef_search rows, so the shortlist can't
+exceed ef_search; the chat pool sets it to max(HNSW_EF_SEARCH, VECTOR_SHORTLIST).
+
+Usage (after ingestion):
+    python -m app.vector_index backfill-short  — add/fill embedding_short from stored embeddings (no API calls)
+    python -m app.vector_index build           — create the HNSW index if missing
+    python -m app.vector_index rebuild         — REINDEX after large bulk loads
+    python -m app.vector_index verify          — validity, plan check, recall@k vs exact search
+    python -m app.vector_index drop
+"""
+
+import os
+import sys
+import math
+import time
+
+from app.db import get_db_connection, release_db_connection, HNSW_EF_SEARCH, VECTOR_SHORTLIST
+
+EMBED_DIMS           = 3072
+EMBED_SHORT_DIMS     = int(os.getenv("EMBED_SHORT_DIMS", "0"))    # 0 → single-pass full-dimension search
+VECTOR_INDEX         = os.getenv("VECTOR_INDEX", "exact")  # "exact" → sequential scan, "hnsw" → ANN index
+INDEX_NAME           = "document_chunks_embedding_hnsw"
+SHORT_INDEX_NAME     = "document_chunks_embedding_short_hnsw"
+HNSW_M               = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+MAINTENANCE_WORK_MEM = os.getenv("HNSW_MAINTENANCE_WORK_MEM", "512MB")
+
+VERIFY_SAMPLES  = 20
+VERIFY_TOP_K    = 20
+BACKFILL_BATCH  = 500
+
+
+def to_vector_literal(embedding: list[float]) -> str:
+    return "[" + ",".join(map(str, embedding)) + "]"
+
+
+def shorten_embedding(embedding: list[float], dims: int = EMBED_SHORT_DIMS) -> list[float]:
+    """Matryoshka truncation: keep the first `dims` components and renormalize to unit length."""
+    head = embedding[:dims]
+    norm = math.sqrt(sum(x * x for x in head)) or 1.0
+    return [x / norm for x in head]
+
+
+def distance_sql(param: str) -> str:
+    """
+    Cosine distance between stored embeddings and a query parameter sent as a
+    pgvector text literal. ORDER BY this expression directly (not a derived
+    score) so the planner can use the HNSW index.
+    """
+    if VECTOR_INDEX == "hnsw":
+        return f"embedding::halfvec({EMBED_DIMS}) <=> {param}::text::halfvec({EMBED_DIMS})"
+    return f"embedding <=> {param}::text::vector"
+
+
+def vector_candidates_sql(emb: str, limit: str, short_emb: str = "", shortlist: str = "") -> str:
+    """
+    Subquery yielding (id, dist) for the `limit` nearest chunks. Parameter
+    placeholders are passed in so the same SQL fits any statement. In
+    two-pass mode short_emb/shortlist must be bound to vector_query_args().
+    """
+    if not EMBED_SHORT_DIMS:
+        return f"""
+            SELECT id, {distance_sql(emb)} AS dist
+            FROM document_chunks
+            ORDER BY {distance_sql(emb)} LIMIT {limit}
+        """
+    return f"""
+            SELECT id, embedding <=> {emb}::text::vector AS dist
+            FROM document_chunks
+            WHERE id IN (
+                SELECT id FROM document_chunks
+                ORDER BY embedding_short <=> {short_emb}::text::halfvec({EMBED_SHORT_DIMS})
+                LIMIT {shortlist}
+            )
+            ORDER BY dist LIMIT {limit}
+        """
+
+
+def vector_query_args(embedding: list[float]) -> tuple:
+    """Extra bind values for vector_candidates_sql beyond the full embedding."""
+    if not EMBED_SHORT_DIMS:
+        return ()
+    return (to_vector_literal(shorten_embedding(embedding)), VECTOR_SHORTLIST)
+
+
+def _index_target() -> tuple[str, str, int]:
+    """(index name, indexed halfvec expression, dims) for the active search mode."""
+    if EMBED_SHORT_DIMS:
+        return SHORT_INDEX_NAME, "embedding_short", EMBED_SHORT_DIMS
+    return INDEX_NAME, f"embedding::halfvec({EMBED_DIMS})", EMBED_DIMS
+
+
+# ── Management commands ───────────────────────────────────────────────────────
+
+def _run_autocommit(statements: list[str]):
+    """CREATE/REINDEX CONCURRENTLY can't run inside a transaction block."""
+    conn = get_db_connection()
+    try:
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("SET statement_timeout = 0")
+        cur.execute(f"SET maintenance_work_mem = '{MAINTENANCE_WORK_MEM}'")
+        for sql in statements:
+            started = time.perf_counter()
+            cur.execute(sql)
+            print(f"{sql.split('(')[0].strip()}  — {time.perf_counter() - started:.1f}s")
+        cur.close()
+    finally:
+        conn.autocommit = False
+        release_db_connection(conn)
+
+
+def build_index():
+    name, expr, _ = _index_target()
+    _run_autocommit([f"""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}
+        ON document_chunks
+        USING hnsw (({expr}) halfvec_cosine_ops)
+        WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})
+    """])
+
+
+def rebuild_index():
+    _run_autocommit([f"REINDEX INDEX CONCURRENTLY {_index_target()[0]}"])
+
+
+def drop_index():
+    _run_autocommit([f"DROP INDEX CONCURRENTLY IF EXISTS {_index_target()[0]}"])
+
+
+def backfill_short() -> dict:
+    """
+    Adds embedding_short halfvec(EMBED_SHORT_DIMS) if missing (recreating it if
+    the configured dims changed) and fills it from the stored full embeddings
+    server-side — truncate + renormalize, no embedding API calls.
+    """
+    if not EMBED_SHORT_DIMS:
+        raise SystemExit("Set EMBED_SHORT_DIMS (e.g. 256, 512, 1024) first.")
+
+    column_type = f"halfvec({EMBED_SHORT_DIMS})"
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SET statement_timeout = 0")
+        cur.execute("""
+            SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = 'document_chunks'::regclass
+              AND attname = 'embedding_short' AND NOT attisdropped
+        """)
+        row = cur.fetchone()
+        if row and row[0] != column_type:
+            print(f"embedding_short is {row[0]}, recreating as {column_type}")
+            cur.execute("ALTER TABLE document_chunks DROP COLUMN embedding_short")
+            row = None
+        if not row:
+            cur.execute(f"ALTER TABLE document_chunks ADD COLUMN embedding_short {column_type}")
+        conn.commit()
+
+        started, filled = time.perf_counter(), 0
+        while True:
+            cur.execute(f"""
+                UPDATE document_chunks
+                SET embedding_short = l2_normalize(subvector(embedding, 1, {EMBED_SHORT_DIMS}))::{column_type}
+                WHERE id IN (
+                    SELECT id FROM document_chunks WHERE embedding_short IS NULL LIMIT %s
+                )
+            """, (BACKFILL_BATCH,))
+            updated = cur.rowcount
+            conn.commit()
+            if not updated:
+                break
+            filled += updated
+            print(f"  backfilled {filled} chunks")
+
+        cur.close()
+        return {"column": column_type, "filled": filled,
+                "seconds": round(time.perf_counter() - started, 1)}
+    finally:
+        release_db_connection(conn)
+
+
+def verify_index() -> dict:
+    """
+    Checks the index exists and is valid, that the ANN query plan uses it,
+    and measures recall@k of the index against exact search on sampled chunks.
+    """
+    name, expr, dims = _index_target()
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SET hnsw.ef_search = {HNSW_EF_SEARCH}")
+
+        cur.execute("""
+            SELECT i.indisvalid, pg_relation_size(i.indexrelid)
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = %s
+        """, (name,))
+        row = cur.fetchone()
+        if not row:
+            return {"exists": False, "index": name}
+        valid, size_bytes = row
+
+        search_sql = f"""
+            SELECT chunk_id FROM document_chunks
+            ORDER BY {expr} <=> %s::text::halfvec({dims})
+            LIMIT %s
+        """
+
+        cur.execute(f"SELECT ({expr})::text FROM document_chunks ORDER BY random() LIMIT %s",
+                    (VERIFY_SAMPLES,))
+        samples = [r[0] for r in cur.fetchall()]
+
+        uses_index = False
+        if samples:
+            cur.execute("EXPLAIN " + search_sql, (samples[0], VERIFY_TOP_K))
+            uses_index = any(name in r[0] for r in cur.fetchall())
+
+        ann = []
+        for emb in samples:
+            cur.execute(search_sql, (emb, VERIFY_TOP_K))
+            ann.append({r[0] for r in cur.fetchall()})
+
+        # Same query with index scans disabled → exact sequential-scan ranking
+        cur.execute("SET LOCAL enable_indexscan = off")
+        recalls = []
+        for emb, approx in zip(samples, ann):
+            cur.execute(search_sql, (emb, VERIFY_TOP_K))
+            exact = {r[0] for r in cur.fetchall()}
+            recalls.append(len(approx & exact) / max(len(exact), 1))
+
+        conn.rollback()
+        cur.close()
+        return {
+            "exists":      True,
+            "index":       name,
+            "valid":       valid,
+            "size_mb":     round(size_bytes / 1024 / 1024, 1),
+            "uses_index":  uses_index,
+            "ef_search":   HNSW_EF_SEARCH,
+            "samples":     len(recalls),
+            "recall_at_k": round(sum(recalls) / len(recalls), 4) if recalls else None,
+            "k":           VERIFY_TOP_K,
+        }
+    finally:
+        release_db_connection(conn)
+
+
+if __name__ == "__main__":
+    commands = {
+        "backfill-short": backfill_short,
+        "build":          build_index,
+        "rebuild":        rebuild_index,
+        "drop":           drop_index,
+        "verify":         verify_index,
+    }
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print(f"usage: python -m app.vector_index {{{'|'.join(commands)}}}")
+        sys.exit(2)
+    result = commands[sys.argv[1]]()
+    if result is not None:
+        print(result)
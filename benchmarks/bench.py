@@ -0,0 +1,258 @@
+"""
+NOVA micro-benchmarks
+=====================
+Times the pure-Python hot paths on synthetic inputs (benchmarks/generators.py)
+and records throughput and allocations:
+
+  retrieval  retrieve_from_scored_chunks, extract_sources, build_context,
+             get_section_key, rrf_fuse
+  chunking   safe_character_split, recursive_split, chunk_markdown_document
+
+Each case is calibrated to ~MIN_TIME per repeat and reports the best and
+median time per call. Allocations are measured on one extra call under
+tracemalloc (peak bytes during the call, bytes still held after it).
+
+Results are appended to benchmarks/results/history.json with the git commit,
+and each run is compared against the previous one.
+
+Usage:
+    python -m benchmarks.bench                       # full suite, saved to history
+    python -m benchmarks.bench --filter rrf          # cases whose name contains "rrf"
+    python -m benchmarks.bench --quick --no-save     # small inputs, don't record
+    python -m benchmarks.bench --large               # adds 8 MB markdown / 1M-row cases
+"""
+
+import io
+import gc
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import statistics
+import subprocess
+import tracemalloc
+from pathlib import Path
+from contextlib import redirect_stdout
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# retrieval_core / final_retreval build their OpenAI and Cohere clients at import;
+# the benchmarks never call them
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-unused")
+os.environ.setdefault("COHERE_API_KEY", "benchmark-unused")
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "data-pipeline" / "ingestion"))
+
+from app.retrieval_core import (
+    retrieve_from_scored_chunks, extract_sources, build_context, get_section_key, count_tokens,
+)
+from chunking import safe_character_split, recursive_split, chunk_markdown_document, headers_splitter, FALLBACK_CHUNK_SIZE
+from benchmarks.generators import scored_chunks, ranked_rows, markdown_document
+
+HISTORY  = Path(__file__).parent / "results" / "history.json"
+MIN_TIME = 0.2   # seconds per repeat
+REPEAT   = 5
+
+CASES: dict[str, callable] = {}
+
+
+def case(name: str):
+    """Registers a case: a function doing untimed setup and returning the callable to time."""
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+# ── Retrieval cases ───────────────────────────────────────────────────────────
+
+def _register_retrieval(sizes: list[int]):
+    for n in sizes:
+        @case(f"retrieve_from_scored_chunks[n={n}]")
+        def _(n=n):
+            scored = scored_chunks(n)
+            return lambda: retrieve_from_scored_chunks(scored)
+
+        @case(f"extract_sources[n={n}]")
+        def _(n=n):
+            scored = scored_chunks(n)
+            return lambda: extract_sources(scored)
+
+        @case(f"get_section_key[n={n}]")
+        def _(n=n):
+            ids = [item["chunk_id"] for _, item in scored_chunks(n)]
+            return lambda: [get_section_key(cid) for cid in ids]
+
+        @case(f"rrf_fuse[n={n}]")
+        def _(n=n):
+            try:
+                from app.final_retreval import rrf_fuse
+            except Exception as e:  # e.g. a database driver missing
+                raise SkipCase(f"app.final_retreval unavailable: {e}")
+            vector_rows, bm25_rows = ranked_rows(n)
+            return lambda: rrf_fuse(vector_rows, bm25_rows, n)
+
+    for n in (20, 200):
+        @case(f"build_context[n={n},warm]")
+        def _(n=n):
+            scored = scored_chunks(n)
+            build_context(scored)  # fill the count_tokens cache
+            return lambda: build_context(scored)
+
+        @case(f"build_context[n={n},cold]")
+        def _(n=n):
+            scored = scored_chunks(n)
+
+            def run():
+                count_tokens.cache_clear()
+                return build_context(scored)
+            return run
+
+
+# ── Chunking cases ────────────────────────────────────────────────────────────
+
+def _register_chunking(sizes: list[int]):
+    for size in sizes:
+        label = f"{size // 1024}KB" if size < 1 << 20 else f"{size >> 20}MB"
+
+        @case(f"safe_character_split[{label}]")
+        def _(size=size):
+            text = markdown_document(size)
+            return lambda: safe_character_split(text, FALLBACK_CHUNK_SIZE)
+
+        @case(f"recursive_split[{label}]")
+        def _(size=size):
+            docs = headers_splitter(markdown_document(size))
+            return lambda: recursive_split(docs)
+
+        @case(f"chunk_markdown_document[{label}]")
+        def _(size=size):
+            markdown = markdown_document(size)
+            return lambda: chunk_markdown_document(markdown, "Benchmark Document")
+
+
+class SkipCase(Exception):
+    pass
+
+
+# ── Measurement ───────────────────────────────────────────────────────────────
+
+def measure(fn, min_time: float = MIN_TIME, repeat: int = REPEAT) -> dict:
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter() - started >= min_time / 10 or loops >= 1 << 20:
+            break
+        loops *= 2
+    loops = max(int(loops * min_time / max(time.perf_counter() - started, 1e-9)), 1)
+
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            samples.append((time.perf_counter() - started) / loops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    result = fn()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    median = statistics.median(samples)
+    return {
+        "loops":        loops,
+        "best_us":      round(min(samples) * 1e6, 2),
+        "median_us":    round(median * 1e6, 2),
+        "ops_per_sec":  round(1 / median, 1),
+        "peak_kib":     round((peak - before) / 1024, 1),
+        "retained_kib": round((after - before) / 1024, 1),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _delta(current: float, previous: float | None) -> str:
+    if not previous:
+        return ""
+    change = (current - previous) / previous * 100
+    return f"{change:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for retrieval and chunking hot paths")
+    parser.add_argument("--filter",  help="Only run cases whose name contains this substring")
+    parser.add_argument("--quick",   action="store_true", help="Small inputs only")
+    parser.add_argument("--large",   action="store_true", help="Add 1M-row and 8 MB cases")
+    parser.add_argument("--no-save", action="store_true", help="Don't append to the history file")
+    parser.add_argument("--label",   help="Free-form note stored with the run")
+    args = parser.parse_args()
+
+    if args.quick:
+        _register_retrieval([20, 1000])
+        _register_chunking([64 * 1024])
+    else:
+        _register_retrieval([20, 1000, 100_000] + ([1_000_000] if args.large else []))
+        _register_chunking([256 * 1024, 2 << 20] + ([8 << 20] if args.large else []))
+
+    history = json.loads(HISTORY.read_text()) if HISTORY.exists() else []
+    previous = history[-1]["results"] if history else {}
+
+    results = {}
+    print(f"{'case':<44} {'median':>12} {'best':>12} {'ops/s':>12} {'peak KiB':>10} {'vs last':>8}")
+    for name, setup in CASES.items():
+        if args.filter and args.filter not in name:
+            continue
+        try:
+            with redirect_stdout(io.StringIO()):  # chunking prints per-document notes
+                fn = setup()
+                stats = measure(fn)
+        except SkipCase as e:
+            print(f"{name:<44} skipped — {e}")
+            continue
+        results[name] = stats
+        print(
+            f"{name:<44} {stats['median_us']:>10.1f}us {stats['best_us']:>10.1f}us "
+            f"{stats['ops_per_sec']:>12,.1f} {stats['peak_kib']:>10,.1f} "
+            f"{_delta(stats['median_us'], previous.get(name, {}).get('median_us')):>8}"
+        )
+
+    if args.no_save or not results:
+        return
+    history.append({
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit":    _git_commit(),
+        "label":     args.label,
+        "python":    platform.python_version(),
+        "machine":   platform.machine(),
+        "results":   results,
+    })
+    HISTORY.parent.mkdir(parents=True, exist_ok=True)
+    HISTORY.write_text(json.dumps(history, indent=2))
+    print(f"\nSaved → {HISTORY.relative_to(ROOT)} ({len(history)} runs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Synthetic inputs for the micro-benchmarks
+=========================================
+Deterministic (seeded) stand-ins shaped like production data:
+
+  scored_chunks(n)          [(score, item)] best first — what retrieve_from_scored_chunks gets after rerank
+  ranked_rows(n)            (vector_rows, bm25_rows) with partial overlap — rrf_fuse input
+  markdown_document(bytes)  marker-style markdown: #..#### headers, prose, tables and a TOC up front
+"""
+
+import random
+
+SECTIONS  = ["Attendance", "Fee Structure", "Hostel Rules", "Examinations", "Admissions",
+             "Scholarships", "Academic Calendar", "Module:3 Data Structures 45 hours"]
+DOCUMENTS = ["academic_regulations_2024", "fee_structure_btech", "hostel-handbook", "UNKNOWN"]
+WORDS = (
+    "students must maintain minimum attendance percentage each course semester fee payable "
+    "hostel allotment examination schedule programme credits elective project registration "
+    "scholarship merit category tuition refund regulations faculty advisor grade"
+).split()
+
+
+def _sentence(rng: random.Random, words: int = 14) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _table(rng: random.Random, rows: int) -> str:
+    lines = ["| Programme | Category | Fee (INR) |", "|---|---|---|"]
+    for _ in range(rows):
+        lines.append(f"| {rng.choice(WORDS).title()} | {rng.choice('ABC')} | {rng.randint(50, 400) * 1000:,} |")
+    return "\n".join(lines)
+
+
+def chunk_text(rng: random.Random) -> str:
+    text = " ".join(_sentence(rng) for _ in range(rng.randint(4, 10)))
+    if rng.random() < 0.15:
+        text += "\n\n" + _table(rng, rng.randint(3, 12))
+    return text
+
+
+def scored_chunks(n: int, seed: int = 0) -> list[tuple[float, dict]]:
+    """Reranked candidates: high top score, long tail, ~5 chunks per section so siblings exist."""
+    rng = random.Random(seed)
+    scored = []
+    for i in range(n):
+        document = rng.choice(DOCUMENTS)
+        section  = SECTIONS[(i // 5) % len(SECTIONS)]
+        scored.append((0.95 * (0.985 ** i), {
+            "chunk_id": f"{document}__{section.lower().replace(' ', '_')}__chunk_{i % 5:03d}",
+            "text":     chunk_text(rng),
+            "metadata": {"document": document, "level_1": section},
+        }))
+    return scored
+
+
+def ranked_rows(n: int, overlap: float = 0.5, seed: int = 0) -> tuple[list, list]:
+    """Two ranked lists of (chunk_id, text, metadata, score) sharing `overlap` of their ids."""
+    rng = random.Random(seed)
+    shared = [f"doc__section__chunk_{i:06d}" for i in range(int(n * overlap))]
+    vector_ids = shared + [f"vec__section__chunk_{i:06d}" for i in range(n - len(shared))]
+    lexical_ids = shared + [f"lex__section__chunk_{i:06d}" for i in range(n - len(shared))]
+    rng.shuffle(vector_ids)
+    rng.shuffle(lexical_ids)
+
+    def rows(ids):
+        return [(cid, chunk_text(rng), {"document": "doc", "level_1": "Section"}, 1.0 / (i + 1))
+                for i, cid in enumerate(ids)]
+
+    return rows(vector_ids), rows(lexical_ids)
+
+
+def markdown_document(target_bytes: int, seed: int = 0) -> str:
+    """Header-structured markdown of roughly target_bytes, starting with a TOC table."""
+    rng = random.Random(seed)
+    toc = ["# Table of Contents", "", "| No. | Section | Page |", "|---|---|---|"]
+    toc += [f"| {i}.{j} | {rng.choice(SECTIONS)} | {i * 3 + j} |" for i in range(1, 6) for j in range(1, 4)]
+    parts = ["\n".join(toc), ""]
+    size = sum(len(p) for p in parts)
+
+    while size < target_bytes:
+        block = [f"# {rng.choice(SECTIONS)} {rng.randint(1, 99)}"]
+        for _ in range(rng.randint(2, 4)):
+            block.append(f"## {rng.choice(WORDS).title()} {rng.choice(WORDS).title()}")
+            for _ in range(rng.randint(1, 3)):
+                block.append(f"### {rng.choice(WORDS).title()}")
+                if rng.random() < 0.3:
+                    block.append(f"#### {rng.choice(WORDS).title()} Details")
+                block.append(" ".join(_sentence(rng) for _ in range(rng.randint(3, 25))))
+                if rng.random() < 0.25:
+                    block.append(_table(rng, rng.randint(4, 60)))
+        text = "\n\n".join(block) + "\n\n"
+        parts.append(text)
+        size += len(text)
+    return "".join(parts)
@@ -0,0 +1,176 @@
+"""
+COPY-based bulk loader for document_chunks
+==========================================
+insert_chunks used to send rows with execute_batch, which renders every
+3072-float vector as a text literal for the server to parse. Here rows are
+streamed with COPY ... FROM STDIN in binary format into a temp staging table,
+then merged into document_chunks in the same transaction, so a document's
+chunks land all at once or not at all.
+
+Binary field encodings (what each type's *_recv function expects):
+  text      raw UTF-8
+  bytea     raw bytes
+  uuid      16 bytes
+  jsonb     version byte 1, then the JSON text
+  integer   int32, big-endian
+  vector    int16 dims, int16 unused, float32 × dims, big-endian (pgvector)
+  halfvec   int16 dims, int16 unused, float16 × dims, big-endian (pgvector ≥ 0.7)
+
+Rows are encoded lazily as COPY reads, so a large document is never held in
+memory twice. copy_out/decode_vector read the same format back (the
+embedding cache fetches stored vectors this way).
+"""
+
+import io
+import sys
+import json
+import uuid
+import struct
+import threading
+from array import array
+
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)  # signature, flags, header extension length
+COPY_TRAILER   = struct.pack(">h", -1)
+READ_SIZE      = 1 << 16
+
+_BIG_ENDIAN = sys.byteorder == "big"
+
+_stats = {"documents": 0, "rows": 0, "bytes": 0, "seconds": 0.0}
+_stats_lock = threading.Lock()
+
+
+# ── Binary encoding ───────────────────────────────────────────────────────────
+
+def _field(data: bytes) -> bytes:
+    return struct.pack(">i", len(data)) + data
+
+
+def encode_text(value: str) -> bytes:
+    return _field(value.encode("utf-8"))
+
+
+def encode_bytea(value: bytes) -> bytes:
+    return _field(value)
+
+
+def encode_uuid(value) -> bytes:
+    return _field(uuid.UUID(str(value)).bytes)
+
+
+def encode_jsonb(value: dict) -> bytes:
+    return _field(b"\x01" + json.dumps(value).encode("utf-8"))
+
+
+def encode_int(value: int) -> bytes:
+    return _field(struct.pack(">i", value))
+
+
+def encode_vector(values: list[float]) -> bytes:
+    floats = array("f", values)
+    if not _BIG_ENDIAN:
+        floats.byteswap()
+    return _field(struct.pack(">HH", len(floats), 0) + floats.tobytes())
+
+
+def encode_halfvec(values: list[float]) -> bytes:
+    return _field(struct.pack(f">HH{len(values)}e", len(values), 0, *values))
+
+
+class CopyStream:
+    """File-like object for copy_expert: encodes tuples on demand and counts bytes sent."""
+
+    def __init__(self, tuples):
+        self._chunks = self._generate(tuples)
+        self._buffer = b""
+        self.bytes = 0
+
+    @staticmethod
+    def _generate(tuples):
+        yield COPY_SIGNATURE
+        for fields in tuples:
+            yield struct.pack(">h", len(fields)) + b"".join(fields)
+        yield COPY_TRAILER
+
+    def read(self, size: int = -1) -> bytes:
+        size = READ_SIZE if size is None or size < 0 else size
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.bytes += len(data)
+        return data
+
+
+# ── Load ──────────────────────────────────────────────────────────────────────
+
+def copy_into_staging(cursor, table: str, columns: list[str], tuples) -> int:
+    """
+    Creates a transaction-scoped staging table shaped like `table` and COPYs
+    the encoded tuples into it. Returns bytes sent.
+    """
+    cursor.execute(
+        f"""
+        CREATE TEMP TABLE IF NOT EXISTS {table}_staging
+        (LIKE public.{table} INCLUDING DEFAULTS) ON COMMIT DROP
+        """
+    )
+    stream = CopyStream(tuples)
+    cursor.copy_expert(
+        f"COPY {table}_staging ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)",
+        stream,
+        size=READ_SIZE,
+    )
+    return stream.bytes
+
+
+def copy_out(cursor, query: str, params=()) -> list[list[bytes | None]]:
+    """Runs COPY (query) TO STDOUT in binary format and returns each row's raw fields."""
+    buffer = io.BytesIO()
+    cursor.copy_expert(
+        f"COPY ({cursor.mogrify(query, params).decode()}) TO STDOUT WITH (FORMAT binary)", buffer,
+    )
+    data = buffer.getvalue()
+    (extension,) = struct.unpack_from(">i", data, len(COPY_SIGNATURE) - 4)
+    pos = len(COPY_SIGNATURE) + extension
+    rows = []
+    while True:
+        (count,) = struct.unpack_from(">h", data, pos)
+        pos += 2
+        if count == -1:
+            return rows
+        fields = []
+        for _ in range(count):
+            (length,) = struct.unpack_from(">i", data, pos)
+            pos += 4
+            if length == -1:
+                fields.append(None)
+                continue
+            fields.append(data[pos:pos + length])
+            pos += length
+        rows.append(fields)
+
+
+def decode_vector(data: bytes) -> list[float]:
+    dims, _ = struct.unpack_from(">HH", data)
+    floats = array("f", data[4:4 + 4 * dims])
+    if not _BIG_ENDIAN:
+        floats.byteswap()
+    return floats.tolist()
+
+
+def record_load(rows: int, sent: int, seconds: float):
+    with _stats_lock:
+        _stats["documents"] += 1
+        _stats["rows"] += rows
+        _stats["bytes"] += sent
+        _stats["seconds"] += seconds
+
+
+def bulk_load_stats() -> dict:
+    """Cumulative COPY totals for this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["rows_per_s"] = round(stats["rows"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+    return stats
@@ -0,0 +1,186 @@
+"""
+Rate-limited concurrent embedding executor
+==========================================
+Sends a document's embedding batches concurrently instead of one at a time,
+under the account's request-per-minute and token-per-minute budgets:
+
+  batching     contiguous slices of at most EMBED_BATCH_TOKENS tokens and
+               EMBED_BATCH_INPUTS inputs (the API rejects requests over either)
+  budget       two token buckets (RPM, TPM), shared by every thread in one
+               process, so concurrent documents in the pipeline split one budget.
+               Separate processes each have their own buckets: ingest_folder's
+               pool gives every worker 1/INGEST_WORKERS of it (set_budget)
+  retries      429 / 5xx / connection errors retry with full-jitter exponential
+               backoff; a Retry-After header pauses every sender, not just the
+               one that got it. insufficient_quota is not retried.
+  order        batches are slices and responses are sorted by `index`, so
+               embeddings[i] always belongs to texts[i]
+
+The caller does tokenization (truncate + count), so this module knows nothing
+about chunks or the tokenizer.
+"""
+
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+EMBED_MODEL        = "text-embedding-3-large"
+EMBED_RPM          = int(os.getenv("EMBED_RPM", "3000"))
+EMBED_TPM          = int(os.getenv("EMBED_TPM", "1000000"))
+EMBED_CONCURRENCY  = int(os.getenv("EMBED_CONCURRENCY", "4"))     # in-flight requests per process
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "80000"))
+EMBED_BATCH_INPUTS = 2048                                          # API limit on inputs per request
+EMBED_MAX_RETRIES  = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+BACKOFF_BASE       = 1.0
+BACKOFF_MAX        = 60.0
+
+
+class TokenBucket:
+    """Refills at `per_minute`/60 per second up to one minute's worth; acquire() blocks until it can pay."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate     = per_minute / 60.0
+        self.tokens   = self.capacity
+        self.updated  = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float) -> float:
+        """Takes `amount` (capped at capacity). Returns seconds spent waiting."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def batch_ranges(token_counts: list[int], max_tokens: int, max_inputs: int) -> list[tuple[int, int]]:
+    """Splits [0, n) into contiguous (start, end) slices within both limits. An oversized text goes alone."""
+    ranges = []
+    start, tokens = 0, 0
+    for i, count in enumerate(token_counts):
+        if i > start and (tokens + count > max_tokens or i - start >= max_inputs):
+            ranges.append((start, i))
+            start, tokens = i, 0
+        tokens += count
+    if start < len(token_counts):
+        ranges.append((start, len(token_counts)))
+    return ranges
+
+
+def _retry_delay(e: Exception, attempt: int) -> float | None:
+    """Seconds to wait before retrying `e`, or None if it isn't retryable."""
+    if isinstance(e, openai.RateLimitError) and getattr(e, "code", None) == "insufficient_quota":
+        return None
+    if isinstance(e, openai.APIStatusError):
+        if e.status_code != 429 and e.status_code < 500:
+            return None
+        retry_after = e.response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+    elif not isinstance(e, openai.APIConnectionError):  # includes APITimeoutError
+        return None
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class EmbeddingExecutor:
+    def __init__(
+        self,
+        client,
+        model: str = EMBED_MODEL,
+        rpm: int = EMBED_RPM,
+        tpm: int = EMBED_TPM,
+        concurrency: int = EMBED_CONCURRENCY,
+        max_batch_tokens: int = EMBED_BATCH_TOKENS,
+        max_batch_inputs: int = EMBED_BATCH_INPUTS,
+        max_retries: int = EMBED_MAX_RETRIES,
+    ):
+        self.client = client.with_options(max_retries=0)  # backoff is handled here, against the shared budget
+        self.model = model
+        self.requests_bucket = TokenBucket(rpm)
+        self.tokens_bucket   = TokenBucket(tpm)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = max_batch_inputs
+        self.max_retries = max_retries
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed")
+        self._lock = threading.Lock()
+        self._pause_until = 0.0
+        self.counters = {"requests": 0, "retries": 0, "rate_limited": 0, "throttled_s": 0.0, "tokens": 0}
+
+    def set_budget(self, rpm: int, tpm: int):
+        """Replaces the RPM/TPM buckets — e.g. with this process's share of the account limit."""
+        self.requests_bucket = TokenBucket(rpm)
+        self.tokens_bucket   = TokenBucket(tpm)
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self.counters[key] += value
+
+    def _pause(self, seconds: float):
+        with self._lock:
+            self._pause_until = max(self._pause_until, time.monotonic() + seconds)
+
+    def _send(self, texts: list[str], tokens: int) -> tuple[list[list[float]], int]:
+        attempt = 0
+        while True:
+            pause = self._pause_until - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            waited = self.requests_bucket.acquire(1) + self.tokens_bucket.acquire(tokens)
+            try:
+                response = self.client.embeddings.create(model=self.model, input=texts)
+            except Exception as e:
+                delay = _retry_delay(e, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                rate_limited = getattr(e, "status_code", None) == 429
+                self._count(retries=1, rate_limited=int(rate_limited), throttled_s=waited)
+                print(f"WARN: embeddings {type(e).__name__}, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                if rate_limited:
+                    self._pause(delay)
+                else:
+                    time.sleep(delay)
+                continue
+            used = response.usage.total_tokens if response.usage else tokens
+            self._count(requests=1, throttled_s=waited, tokens=used)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)], used
+
+    def embed(self, texts: list[str], token_counts: list[int]) -> tuple[list[list[float]], int]:
+        """Embeds texts (already truncated) concurrently. Returns (embeddings in input order, tokens used)."""
+        ranges = batch_ranges(token_counts, self.max_batch_tokens, self.max_batch_inputs)
+        futures = [
+            self.pool.submit(self._send, texts[start:end], sum(token_counts[start:end]))
+            for start, end in ranges
+        ]
+        embeddings, used = [], 0
+        try:
+            for future in futures:  # in submission order, so output order matches input order
+                batch, tokens = future.result()
+                embeddings.extend(batch)
+                used += tokens
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+        return embeddings, used
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
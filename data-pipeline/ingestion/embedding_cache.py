@@ -0,0 +1,117 @@
+"""
+Persistent embedding cache
+==========================
+Postgres side table (sql/embedding_cache.sql) of embeddings keyed by
+(SHA-256 of the truncated text actually sent, model, dims). embed_chunks looks
+every chunk up before calling the API and stores what it had to embed, so a
+re-ingested PDF with one revised clause, or a re-chunking experiment, pays
+only for text the cache hasn't seen.
+
+Vectors move in binary COPY both ways (bulk_load), not as text literals.
+Cache errors never fail ingestion: a missing table disables the cache for the
+process with one warning, other errors fall through to the API.
+"""
+
+import os
+import hashlib
+import threading
+
+import psycopg2
+import psycopg2.errors
+
+from app.db import get_db_connection, release_db_connection
+from .bulk_load import copy_into_staging, copy_out, decode_vector, encode_bytea, encode_text, encode_int, encode_vector
+
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") != "0"
+
+_enabled = EMBEDDING_CACHE
+_stats = {"hits": 0, "misses": 0, "tokens_saved": 0, "stored": 0}
+_lock = threading.Lock()
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def _disable(e: Exception):
+    global _enabled
+    if _enabled:
+        print(f"WARN: embedding cache disabled — {e}".strip())
+        print("WARN: run sql/embedding_cache.sql to enable it")
+    _enabled = False
+
+
+def lookup_embeddings(keys: list[bytes], model: str, dims: int) -> dict[bytes, list[float]]:
+    if not _enabled or not keys:
+        return {}
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        rows = copy_out(
+            cursor,
+            """
+            SELECT text_sha256, embedding FROM embedding_cache
+            WHERE model = %s AND dims = %s AND text_sha256 = ANY(%s)
+            """,
+            (model, dims, [psycopg2.Binary(key) for key in set(keys)]),
+        )
+        cursor.close()
+    except psycopg2.errors.UndefinedTable as e:
+        _disable(e)
+        return {}
+    except psycopg2.Error as e:
+        print(f"WARN: embedding cache lookup failed — {e}".strip())
+        return {}
+    finally:
+        release_db_connection(conn)
+    return {bytes(key): decode_vector(vector) for key, vector in rows}
+
+
+def store_embeddings(entries: dict[bytes, list[float]], model: str, dims: int):
+    if not _enabled or not entries:
+        return
+    model_field, dims_field = encode_text(model), encode_int(dims)
+    tuples = ([encode_bytea(key), model_field, dims_field, encode_vector(emb)] for key, emb in entries.items())
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        copy_into_staging(cursor, "embedding_cache", ["text_sha256", "model", "dims", "embedding"], tuples)
+        cursor.execute(
+            """
+            INSERT INTO embedding_cache (text_sha256, model, dims, embedding)
+            SELECT text_sha256, model, dims, embedding FROM embedding_cache_staging
+            ON CONFLICT DO NOTHING
+            """
+        )
+        stored = cursor.rowcount
+        conn.commit()
+        cursor.close()
+    except psycopg2.errors.UndefinedTable as e:
+        conn.rollback()
+        _disable(e)
+        return
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"WARN: embedding cache store failed — {e}".strip())
+        return
+    finally:
+        release_db_connection(conn)
+    with _lock:
+        _stats["stored"] += stored
+
+
+def record_lookups(hits: int, misses: int, tokens_saved: int):
+    with _lock:
+        _stats["hits"] += hits
+        _stats["misses"] += misses
+        _stats["tokens_saved"] += tokens_saved
+
+
+def embedding_cache_stats() -> dict:
+    """Cumulative lookups for this process; hit_rate is per chunk."""
+    with _lock:
+        stats = dict(_stats)
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / total, 4) if total else 0.0
+    stats["enabled"] = _enabled
+    return stats
@@ -0,0 +1,79 @@
+"""
+Extracted-markdown cache
+========================
+marker is by far the slowest ingestion step, and its output used to be thrown
+away once chunked — any change to MAX_CHARS, the TOC filter or the header
+splitter meant re-extracting every PDF. The markdown is now kept on disk, one
+gzip'd JSON file per PDF:
+
+  key      compute_fingerprint(pdf) SHA-256 + extractor version
+  value    {"markdown", "pages", "extractor", "convert_s"}
+
+The extractor version is the installed marker-pdf version plus
+EXTRACT_CACHE_VERSION (bump it when converter settings change), so upgrading
+marker misses the cache instead of serving stale output. Entries are written
+to a temp file and renamed into place, so concurrent workers or an interrupted
+run never leave a truncated entry behind. INGEST_FORCE_EXTRACT=1 (or
+--force-extract) re-runs marker and overwrites the entry.
+"""
+
+import os
+import gzip
+import json
+import tempfile
+from pathlib import Path
+from functools import lru_cache
+from importlib import metadata
+
+EXTRACT_CACHE_DIR     = Path(os.getenv("EXTRACT_CACHE_DIR", Path(__file__).resolve().parent.parent / ".extract_cache"))
+EXTRACT_CACHE_VERSION = "1"                                           # bump when PdfConverter settings change
+FORCE_EXTRACT         = os.getenv("INGEST_FORCE_EXTRACT", "0") == "1"
+
+
+@lru_cache(maxsize=1)
+def extractor_version() -> str:
+    try:
+        marker = metadata.version("marker-pdf")
+    except metadata.PackageNotFoundError:
+        marker = "unknown"
+    return f"marker-{marker}-v{EXTRACT_CACHE_VERSION}"
+
+
+def cache_path(fingerprint: str) -> Path:
+    return EXTRACT_CACHE_DIR / f"{fingerprint}.{extractor_version()}.json.gz"
+
+
+def load_extraction(fingerprint: str) -> tuple[str, dict] | None:
+    """Cached (markdown, {"pages", "seconds", "cached"}) for a PDF, or None on a miss."""
+    path = cache_path(fingerprint)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            entry = json.load(f)
+        return entry["markdown"], {"pages": entry["pages"], "seconds": 0.0, "cached": True}
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, KeyError) as e:
+        print(f"WARN: ignoring unreadable extraction cache entry {path.name}: {e}")
+        return None
+
+
+def store_extraction(fingerprint: str, markdown: str, extraction: dict):
+    """Writes an entry atomically. Failures only warn — the cache is never required."""
+    path = cache_path(fingerprint)
+    entry = {
+        "markdown":  markdown,
+        "pages":     extraction["pages"],
+        "extractor": extractor_version(),
+        "convert_s": round(extraction["seconds"], 2),
+    }
+    tmp = None
+    try:
+        EXTRACT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=EXTRACT_CACHE_DIR, prefix=f".{path.name}.", suffix=".tmp")
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+            f.write(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"WARN: could not write extraction cache entry {path.name}: {e}")
+        if tmp and os.path.exists(tmp):
+            os.unlink(tmp)
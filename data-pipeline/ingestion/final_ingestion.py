@@ -1,13 +1,19 @@
-import json
 from openai import OpenAI
-from psycopg2.extras import execute_batch
 from dotenv import load_dotenv
 load_dotenv()
 import os
+import time
 import hashlib
 import tiktoken
 
 from app.db import get_db_connection, release_db_connection
+from app.vector_index import EMBED_DIMS, EMBED_SHORT_DIMS, shorten_embedding
+from .embedding import EmbeddingExecutor, EMBED_RPM, EMBED_TPM
+from .embedding_cache import text_key, lookup_embeddings, store_embeddings, record_lookups
+from .bulk_load import (
+    copy_into_staging, record_load,
+    encode_text, encode_uuid, encode_jsonb, encode_int, encode_vector, encode_halfvec,
+)
 
 MAX_EMBED_TOKENS = 7500
 
@@ -16,34 +22,17 @@ tokenizer = tiktoken.get_encoding("cl100k_base")
 def count_tokens(text: str) -> int:
     return len(tokenizer.encode(text))
 
-def batch_chunks_by_tokens(chunks, max_tokens=80000):
-    batches = []
-    current_batch = []
-    current_tokens = 0
-
-    for chunk in chunks:
-        tokens = count_tokens(chunk["text"])
-
-        if tokens > max_tokens:
-            # Extremely large chunk → still embed alone
-            batches.append([chunk])
-            continue
-
-        if current_tokens + tokens > max_tokens:
-            batches.append(current_batch)
-            current_batch = []
-            current_tokens = 0
-
-        current_batch.append(chunk)
-        current_tokens += tokens
-
-    if current_batch:
-        batches.append(current_batch)
-
-    return batches
+client = OpenAI()
+embedder = EmbeddingExecutor(client)
 
 
-client = OpenAI()
+def share_embedding_budget(processes: int):
+    """
+    Limits this process to 1/processes of EMBED_RPM / EMBED_TPM. The buckets are
+    per process but the account limit isn't, so every process embedding at once
+    must take its share. Used as the ingest_folder pool initializer.
+    """
+    embedder.set_budget(max(EMBED_RPM // processes, 1), max(EMBED_TPM // processes, 1))
 
 
 def compute_fingerprint(file_path: str) -> str:
@@ -60,6 +49,14 @@ def truncate_to_token_limit(text: str, max_tokens: int = MAX_EMBED_TOKENS) -> st
     return tokenizer.decode(tokens[:max_tokens])
 
 
+def prepare_for_embedding(text: str, max_tokens: int = MAX_EMBED_TOKENS) -> tuple[str, int]:
+    """truncate_to_token_limit plus the resulting token count, from a single encode."""
+    tokens = tokenizer.encode(text)
+    if len(tokens) <= max_tokens:
+        return text, len(tokens)
+    return tokenizer.decode(tokens[:max_tokens]), max_tokens
+
+
 def insert_document(document_id: str, document_name: str, fingerprint: str, status: str = "processing") -> str:
     conn = get_db_connection()
     try:
@@ -86,50 +83,106 @@ def insert_document(document_id: str, document_name: str, fingerprint: str, stat
     finally:
         release_db_connection(conn)
 
-def embed_and_insert(chunks, document_id):
-    batches = batch_chunks_by_tokens(chunks)
-    total_inserted = 0
-
-    for batch in batches:
-        texts = [truncate_to_token_limit(c["text"]) for c in batch]
-
-        response = client.embeddings.create(
-            model="text-embedding-3-large",
-            input=texts
-        )
-
-        embeddings = [item.embedding for item in response.data]
-
-        rows = []
-        for chunk, emb in zip(batch, embeddings):
-            rows.append((
-                chunk["chunk_id"],
-                document_id,
-                chunk["metadata"]["document"],
-                chunk["text"],
-                emb,
-                json.dumps(chunk["metadata"]),
-                chunk["metadata"]["char_count"]
-            ))
-
-        conn = get_db_connection()
-        try:
-            cursor = conn.cursor()
-            query = """
-                INSERT INTO public.document_chunks
-                (chunk_id, document_id, document_text, text, embedding, metadata, char_count)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (chunk_id) DO NOTHING
-            """
-            execute_batch(cursor, query, rows)
-            conn.commit()
-            cursor.close()
-        finally:
-            release_db_connection(conn)
+def embed_chunks(chunks) -> tuple[list[list[float]], int, int]:
+    """
+    Embeds chunks, serving repeats from the embedding cache and sending only
+    unseen texts (once each) to the API. Returns (embeddings in chunk order,
+    API tokens used, chunks served from the cache).
+    """
+    prepared = [prepare_for_embedding(c["text"]) for c in chunks]
+    keys = [text_key(text) for text, _ in prepared]
+    found = lookup_embeddings(keys, embedder.model, EMBED_DIMS)
+
+    pending: dict[bytes, int] = {}  # key → first chunk needing it
+    for i, key in enumerate(keys):
+        if key not in found and key not in pending:
+            pending[key] = i
+
+    tokens = 0
+    if pending:
+        order = list(pending.values())
+        fresh, tokens = embedder.embed([prepared[i][0] for i in order], [prepared[i][1] for i in order])
+        new = dict(zip(pending, fresh))
+        store_embeddings(new, embedder.model, EMBED_DIMS)
+    else:
+        new = {}
+
+    hits = [i for i, key in enumerate(keys) if key in found]
+    record_lookups(len(hits), len(keys) - len(hits), sum(prepared[i][1] for i in hits))
+    return [found.get(key) or new[key] for key in keys], tokens, len(hits)
+
+
+CHUNK_COLUMNS = ["chunk_id", "document_id", "document_text", "text", "embedding", "metadata", "char_count"]
+
+
+def copy_chunks(cursor, chunks, embeddings, document_id) -> tuple[list[str], int]:
+    """COPYs embedded chunks (binary) into the document_chunks staging table. Returns (columns, bytes sent)."""
+    columns = CHUNK_COLUMNS + (["embedding_short"] if EMBED_SHORT_DIMS else [])
+    document_field = encode_uuid(document_id)
+
+    def tuples():
+        for chunk, emb in zip(chunks, embeddings):
+            fields = [
+                encode_text(chunk["chunk_id"]),
+                document_field,
+                encode_text(chunk["metadata"]["document"]),
+                encode_text(chunk["text"]),
+                encode_vector(emb),
+                encode_jsonb(chunk["metadata"]),
+                encode_int(chunk["metadata"]["char_count"]),
+            ]
+            if EMBED_SHORT_DIMS:
+                fields.append(encode_halfvec(shorten_embedding(emb)))
+            yield fields
+
+    return columns, copy_into_staging(cursor, "document_chunks", columns, tuples())
+
+
+def merge_staged_chunks(cursor, columns: list[str]) -> int:
+    """Moves staged rows into document_chunks (caller's transaction). Returns rows inserted."""
+    cursor.execute(
+        f"""
+        INSERT INTO public.document_chunks ({', '.join(columns)})
+        SELECT {', '.join(columns)} FROM document_chunks_staging
+        ON CONFLICT (chunk_id) DO NOTHING
+        """
+    )
+    return cursor.rowcount
+
+
+def insert_chunks(chunks, embeddings, document_id) -> dict:
+    """
+    COPYs a document's embedded chunks into a staging table and merges them
+    into document_chunks in one transaction. Returns {"rows", "bytes", "seconds"}.
+    """
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        columns, sent = copy_chunks(cursor, chunks, embeddings, document_id)
+        inserted = merge_staged_chunks(cursor, columns)
+        conn.commit()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+    seconds = time.perf_counter() - started
+    record_load(inserted, sent, seconds)
+    return {"rows": inserted, "bytes": sent, "seconds": seconds}
 
-        total_inserted += len(rows)
 
-    print(f"Ingested {total_inserted} chunks in {len(batches)} batches")
+def embed_and_insert(chunks, document_id) -> dict:
+    """Embeds and COPYs a document's chunks. Returns the load's {"rows", "bytes", "seconds"}."""
+    started = time.perf_counter()
+    embeddings, _, cache_hits = embed_chunks(chunks)
+    load = insert_chunks(chunks, embeddings, document_id)
+    print(
+        f"Ingested {load['rows']} chunks in {time.perf_counter() - started:.1f}s "
+        f"({cache_hits}/{len(chunks)} embeddings from cache, {load['bytes'] / 1e6:.1f} MB COPYed)"
+    )
+    return load
 
 
 def update_document_status(document_id: str, status: str, error_message: str | None = None):
@@ -169,4 +222,27 @@ def document_exists_by_fingerprint(fingerprint: str) -> bool:
         cursor.close()
         return exists
     finally:
-        release_db_connection(conn)
\ No newline at end of file
+        release_db_connection(conn)
+
+
+def find_document_by_name(document_name: str) -> tuple[str, str, str] | None:
+    """Latest live version of a document: (document_id, fingerprint, status), or None."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT document_id::text, fingerprint, status
+            FROM documents
+            WHERE document_name = %s
+            AND status IN ('done', 'pending_update')
+            ORDER BY updated_at DESC
+            LIMIT 1
+            """,
+            (document_name,),
+        )
+        row = cursor.fetchone()
+        cursor.close()
+        return row
+    finally:
+        release_db_connection(conn)
@@ -0,0 +1,198 @@
+"""
+Incremental document updates
+============================
+Re-ingesting a changed PDF used to mean wiping its chunks (admin reingest)
+and re-embedding all of them, with the document missing from search until
+the run finished. An incremental update instead diffs the new chunking
+against what's stored, by content hash:
+
+  keep     same chunk_id, same content           untouched
+  rename   same content, new chunk_id            row kept, chunk_id updated (embedding reused)
+  insert   content not stored anywhere           embedded and COPYed in
+  delete   stored content no longer produced     removed
+
+Chunk ids are positional (doc__section__chunk_003), so an inserted paragraph
+shifts every later id in its section. Renames are applied in two phases —
+first to a temporary id, then to the final one — so swaps and shifts never
+collide on the unique chunk_id.
+
+Delete, renames, insert and the documents row update (fingerprint, status)
+commit in one transaction, so queries see the old version or the new one,
+never a gap. Cost is proportional to the change: only `insert` chunks are
+embedded.
+"""
+
+import json
+import time
+import hashlib
+
+from app.db import get_db_connection, release_db_connection
+from .bulk_load import record_load
+from .final_ingestion import embed_chunks, copy_chunks, merge_staged_chunks, find_document_by_name
+
+RENAME_SUFFIX = "#pending-rename"
+
+
+def chunk_hash(text: str, metadata: dict) -> str:
+    payload = text + "\x00" + json.dumps(metadata, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def update_target(document_name: str, fingerprint: str, incremental: bool, rechunk: bool = False) -> tuple[str, str] | None:
+    """
+    The stored document a new version of `document_name` should update in place,
+    as (document_id, current status): always for one marked 'pending_update' by
+    the admin API, with `incremental` for any live document whose PDF changed,
+    and with `rechunk` for any live document at all (same PDF, new chunking).
+    """
+    row = find_document_by_name(document_name)
+    if row is None:
+        return None
+    document_id, stored_fingerprint, status = row
+    if status == "pending_update" or rechunk or (incremental and stored_fingerprint != fingerprint):
+        return document_id, status
+    return None
+
+
+def _stored_hashes(cursor, document_id: str) -> dict[str, str]:
+    cursor.execute(
+        "SELECT chunk_id, text, metadata FROM document_chunks WHERE document_id = %s",
+        (document_id,),
+    )
+    return {chunk_id: chunk_hash(text, metadata) for chunk_id, text, metadata in cursor.fetchall()}
+
+
+def plan_update(document_id: str, chunks: list[dict]) -> dict:
+    """Diffs new chunks against the stored ones. Read-only; apply_update re-checks the snapshot."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        stored = _stored_hashes(cursor, document_id)
+        cursor.close()
+    finally:
+        release_db_connection(conn)
+
+    keep, unmatched = [], []
+    claimed = set()
+    for chunk in chunks:
+        h = chunk_hash(chunk["text"], chunk["metadata"])
+        if stored.get(chunk["chunk_id"]) == h:
+            keep.append(chunk["chunk_id"])
+            claimed.add(chunk["chunk_id"])
+        else:
+            unmatched.append((chunk, h))
+
+    # Content that moved: pair each new chunk with an unclaimed stored chunk of the same hash
+    by_hash: dict[str, list[str]] = {}
+    for chunk_id, h in stored.items():
+        if chunk_id not in claimed:
+            by_hash.setdefault(h, []).append(chunk_id)
+
+    renames, inserts = [], []
+    for chunk, h in unmatched:
+        if by_hash.get(h):
+            old_id = by_hash[h].pop()
+            renames.append((old_id, chunk["chunk_id"]))
+            claimed.add(old_id)
+        else:
+            inserts.append(chunk)
+
+    return {
+        "document_id": document_id,
+        "snapshot":    stored,
+        "keep":        keep,
+        "rename":      renames,
+        "insert":      inserts,
+        "delete":      [chunk_id for chunk_id in stored if chunk_id not in claimed],
+    }
+
+
+def apply_update(plan: dict, embeddings: list[list[float]], fingerprint: str) -> dict:
+    """Applies a plan in one transaction and marks the document done with its new fingerprint."""
+    document_id = plan["document_id"]
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM documents WHERE document_id = %s FOR UPDATE", (document_id,))
+        if cursor.fetchone() is None:
+            raise ValueError(f"Document {document_id} no longer exists")
+        if _stored_hashes(cursor, document_id) != plan["snapshot"]:
+            raise RuntimeError("Chunks changed since the update was planned — re-run the update")
+
+        if plan["delete"]:
+            cursor.execute(
+                "DELETE FROM document_chunks WHERE document_id = %s AND chunk_id = ANY(%s)",
+                (document_id, plan["delete"]),
+            )
+
+        if plan["rename"]:
+            old_ids = [old for old, _ in plan["rename"]]
+            new_ids = [new for _, new in plan["rename"]]
+            cursor.execute(
+                "UPDATE document_chunks SET chunk_id = chunk_id || %s WHERE document_id = %s AND chunk_id = ANY(%s)",
+                (RENAME_SUFFIX, document_id, old_ids),
+            )
+            cursor.execute(
+                """
+                UPDATE document_chunks c
+                SET chunk_id = r.new_id
+                FROM unnest(%s::text[], %s::text[]) AS r(old_id, new_id)
+                WHERE c.document_id = %s AND c.chunk_id = r.old_id || %s
+                """,
+                (old_ids, new_ids, document_id, RENAME_SUFFIX),
+            )
+
+        inserted, sent = 0, 0
+        if plan["insert"]:
+            columns, sent = copy_chunks(cursor, plan["insert"], embeddings, document_id)
+            inserted = merge_staged_chunks(cursor, columns)
+            if inserted != len(plan["insert"]):
+                raise RuntimeError(
+                    f"{len(plan['insert']) - inserted} new chunk ids already belong to another document"
+                )
+
+        cursor.execute(
+            """
+            UPDATE documents
+            SET fingerprint   = %s,
+                status        = 'done',
+                error_message = NULL,
+                updated_at    = now()
+            WHERE document_id = %s
+            """,
+            (fingerprint, document_id),
+        )
+        conn.commit()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+    seconds = time.perf_counter() - started
+    if inserted:
+        record_load(inserted, sent, seconds)
+    return {
+        "kept":     len(plan["keep"]),
+        "renamed":  len(plan["rename"]),
+        "inserted": inserted,
+        "deleted":  len(plan["delete"]),
+        "bytes":    sent,
+        "seconds":  seconds,
+    }
+
+
+def update_document_incremental(document_id: str, chunks: list[dict], fingerprint: str) -> dict:
+    """plan → embed only the new chunks → apply. Returns counts plus API tokens used."""
+    plan = plan_update(document_id, chunks)
+    embeddings, tokens, _ = embed_chunks(plan["insert"]) if plan["insert"] else ([], 0, 0)
+    return {**apply_update(plan, embeddings, fingerprint), "tokens": tokens}
+
+
+def describe(counts: dict) -> str:
+    return (
+        f"+{counts['inserted']} new, -{counts['deleted']} removed, "
+        f"{counts['renamed']} renamed, {counts['kept']} unchanged"
+    )
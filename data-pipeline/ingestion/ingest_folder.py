@@ -1,46 +1,62 @@
 import os
 import uuid
 import traceback
+import multiprocessing
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from .scan import extract_text_from_pdf
+from .scan import extract_pdf, extractor_stats
+from .extraction_cache import FORCE_EXTRACT
 from .chunking import chunk_markdown_document
 from .final_ingestion import (
     embed_and_insert,
     insert_document,
     compute_fingerprint,
     update_document_status,
-    document_exists_by_fingerprint
+    document_exists_by_fingerprint,
+    share_embedding_budget,
 )
+from .incremental import update_target, update_document_incremental, describe
 
-MAX_WORKERS = 3  # Keep low — marker is RAM/VRAM heavy. Tune between 2–4.
+MAX_WORKERS = int(os.getenv("INGEST_WORKERS", "3"))  # Keep low — each worker holds its own copy of the marker models (RAM/VRAM). Tune between 1–4.
+INCREMENTAL = os.getenv("INGEST_INCREMENTAL", "0") == "1"  # update changed PDFs in place instead of adding a new document
 
 
-def ingest_single(pdf_path: str, filename: str) -> str:
+def ingest_single(
+    pdf_path: str,
+    filename: str,
+    incremental: bool = INCREMENTAL,
+    force_extract: bool = FORCE_EXTRACT,
+) -> tuple[str, dict, dict | None]:
     """
     Processes a single PDF end-to-end.
     Must be a top-level function so ProcessPoolExecutor can pickle it.
-    Returns a status string for logging.
+    Returns a status string for logging, the worker's extractor stats and the
+    document's COPY load ({"rows", "bytes", "seconds"}, None if nothing was written).
     """
     document_name = os.path.splitext(filename)[0]
     document_id = str(uuid.uuid4())
+    target = None
 
     try:
         # 1. Compute fingerprint
         fingerprint = compute_fingerprint(pdf_path)
         if document_exists_by_fingerprint(fingerprint):
-            return f"⏭️  Skipped (already ingested): {filename}"
-
-        # 2. Insert document row
-        document_id = insert_document(
-            document_id=document_id,
-            document_name=document_name,
-            fingerprint=fingerprint,
-            status="processing",
-        )
-
-        # 3. Extract text
-        markdown = extract_text_from_pdf(pdf_path)
+            return f"⏭️  Skipped (already ingested): {filename}", extractor_stats(), None
+
+        # 2. Insert document row — or update the stored version in place
+        target = update_target(document_name, fingerprint, incremental)
+        if target:
+            document_id = target[0]
+        else:
+            document_id = insert_document(
+                document_id=document_id,
+                document_name=document_name,
+                fingerprint=fingerprint,
+                status="processing",
+            )
+
+        # 3. Extract text (or read it back from the extraction cache)
+        markdown, extraction = extract_pdf(pdf_path, fingerprint, force=force_extract)
         if not markdown or len(markdown.strip()) < 500:
             raise ValueError("Extracted text too small or empty")
 
@@ -52,8 +68,16 @@ def ingest_single(pdf_path: str, filename: str) -> str:
         if not chunks:
             raise ValueError("No chunks produced")
 
+        if target:
+            counts = update_document_incremental(document_id, chunks, fingerprint)
+            return (
+                f"🔁 Updated: {filename} ({describe(counts)}; {describe_extraction(extraction)})",
+                extractor_stats(),
+                {"rows": counts["inserted"], "bytes": counts["bytes"], "seconds": counts["seconds"]},
+            )
+
         # 5. Embed + insert
-        embed_and_insert(
+        load = embed_and_insert(
             chunks=chunks,
             document_id=document_id,
         )
@@ -61,19 +85,31 @@ def ingest_single(pdf_path: str, filename: str) -> str:
         # 6. Mark success
         update_document_status(document_id=document_id, status="done")
 
-        return f"✅ Success: {filename} ({len(chunks)} chunks)"
+        return (
+            f"✅ Success: {filename} ({len(chunks)} chunks, {describe_extraction(extraction)})",
+            extractor_stats(),
+            load,
+        )
 
     except Exception as e:
+        # A failed in-place update leaves the old version live — keep its status
         update_document_status(
             document_id=document_id,
-            status="failed",
+            status=target[1] if target else "failed",
             error_message=str(e),
         )
         tb = traceback.format_exc()
-        return f"❌ Failed: {filename} — {type(e).__name__}: {e}\n{tb}"
+        return f"❌ Failed: {filename} — {type(e).__name__}: {e}\n{tb}", extractor_stats(), None
+
 
+def describe_extraction(extraction: dict) -> str:
+    if extraction.get("cached"):
+        return f"{extraction['pages']} pages from the extraction cache"
+    per_page = extraction["seconds"] / max(extraction["pages"], 1)
+    return f"{extraction['pages']} pages extracted in {extraction['seconds']:.1f}s — {per_page:.2f}s/page"
 
-def ingest_folder(pdf_folder: str):
+
+def ingest_folder(pdf_folder: str, incremental: bool = INCREMENTAL, force_extract: bool = FORCE_EXTRACT):
     if not os.path.isdir(pdf_folder):
         raise ValueError(f"Not a directory: {pdf_folder}")
 
@@ -88,11 +124,23 @@ def ingest_folder(pdf_folder: str):
 
     print(f"Starting ingestion of {len(pdf_files)} PDFs with {MAX_WORKERS} workers...\n")
 
+    # spawn, not fork: marker initializes CUDA, which can't be re-initialized in a
+    # forked child. Each worker loads the models once, on its first extraction
+    # cache miss (init_extractor), so a fully cached run never loads them.
+    # Every worker embeds concurrently, so each gets 1/MAX_WORKERS of the RPM/TPM budget.
     futures = {}
-    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
+    workers = {}
+    loads = []
+    executor = ProcessPoolExecutor(
+        max_workers=MAX_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=share_embedding_budget,
+        initargs=(MAX_WORKERS,),
+    )
+    with executor:
         for filename in pdf_files:
             pdf_path = os.path.join(pdf_folder, filename)
-            future = executor.submit(ingest_single, pdf_path, filename)
+            future = executor.submit(ingest_single, pdf_path, filename, incremental, force_extract)
             futures[future] = filename
 
         for future in as_completed(futures):
@@ -100,11 +148,49 @@ def ingest_folder(pdf_folder: str):
             print("=" * 80)
             print(f"Finished: {filename}")
             try:
-                result = future.result()
+                result, stats, load = future.result()
                 print(result)
+                workers[stats["pid"]] = stats
+                if load:
+                    loads.append(load)
             except Exception as e:
                 # Shouldn't happen since ingest_single catches internally,
                 # but guard anyway
                 print(f"❌ Unhandled error for {filename}: {e}")
 
-    print("\nIngestion completed.")
\ No newline at end of file
+    print("\nIngestion completed.")
+    print_extraction_summary(workers)
+    print_load_summary(loads)
+
+
+def print_extraction_summary(workers: dict):
+    if not workers:
+        return
+    load = [w["model_load_s"] for w in workers.values() if w["model_load_s"]]
+    pages = sum(w["pages"] for w in workers.values())
+    convert = sum(w["convert_s"] for w in workers.values())
+    documents = sum(w["documents"] for w in workers.values())
+    cache_hits = sum(w.get("cache_hits", 0) for w in workers.values())
+    if load:
+        print(
+            f"Model load: {sum(load):.1f}s across {len(load)} workers "
+            f"(max {max(load):.1f}s, once per worker)"
+        )
+    print(
+        f"Extraction: {documents} documents, {pages} pages in {convert:.1f}s of worker time "
+        f"— {convert / max(pages, 1):.2f}s/page"
+    )
+    if cache_hits:
+        print(f"Extraction cache: {cache_hits} documents read back without running marker")
+
+
+def print_load_summary(loads: list[dict]):
+    if not loads:
+        return
+    rows = sum(load["rows"] for load in loads)
+    sent = sum(load["bytes"] for load in loads)
+    seconds = sum(load["seconds"] for load in loads)
+    print(
+        f"COPY load: {rows} rows, {sent / 1e6:.1f} MB sent in {seconds:.1f}s of worker time "
+        f"— {rows / seconds if seconds else 0.0:,.1f} rows/s"
+    )
@@ -0,0 +1,381 @@
+"""
+Staged ingestion pipeline
+=========================
+ingest_single runs fingerprint → extract → chunk → embed → insert strictly in
+sequence, so the GPU idles while the embeddings API answers and the network
+idles while marker runs. Here each step is a stage with its own workers,
+connected by bounded queues:
+
+  feed (main thread)   fingerprint, skip already-ingested, insert 'processing' row
+  extract              marker + chunking in a spawn process pool (models loaded once per process);
+                       PDFs in the extraction cache are chunked in-thread and never reach marker
+  embed                embeddings API calls
+  insert               document_chunks write, mark 'done'
+
+With --incremental (or for documents marked 'pending_update'), a changed PDF
+updates its stored version in place: embed diffs the new chunks against the
+stored ones and embeds only new content; insert applies the diff atomically
+(incremental.py). --rechunk does the same for unchanged PDFs: after a
+chunking change it re-chunks the cached markdown of every ingested document
+and applies the diff, so the corpus re-chunks without re-running marker and
+only genuinely new chunks are embedded.
+
+Extraction of document N+1 overlaps embedding and writing of document N. The
+queues hold at most INGEST_QUEUE_SIZE documents between stages, so a slow
+stage blocks the one feeding it instead of piling extracted documents up in
+memory. A document that fails in any stage is marked 'failed' and dropped.
+
+The run ends with a throughput report (pages/s, chunks/s, tokens/s) and, per
+stage, busy time, utilization and time spent blocked on the next stage — the
+stage with high utilization and nothing blocked behind it is the bottleneck.
+
+Usage:
+    python -m data-pipeline.ingestion.pipeline data/
+    python -m data-pipeline.ingestion.pipeline data/ --rechunk
+    INGEST_EXTRACT_WORKERS=1 INGEST_EMBED_WORKERS=4 python -m data-pipeline.ingestion.pipeline data/
+"""
+
+import os
+import sys
+import time
+import uuid
+import queue
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .scan import init_extractor, extract_pdf, extractor_stats
+from .chunking import chunk_markdown_document
+from .extraction_cache import load_extraction, FORCE_EXTRACT
+from .ingest_folder import print_extraction_summary, INCREMENTAL
+from .incremental import update_target, plan_update, apply_update, describe
+from .bulk_load import bulk_load_stats
+from .embedding_cache import embedding_cache_stats
+from .final_ingestion import (
+    embedder,
+    embed_chunks,
+    insert_chunks,
+    insert_document,
+    compute_fingerprint,
+    update_document_status,
+    document_exists_by_fingerprint,
+)
+
+EXTRACT_WORKERS = int(os.getenv("INGEST_EXTRACT_WORKERS", "1"))  # marker processes — each holds its own models
+EMBED_WORKERS   = int(os.getenv("INGEST_EMBED_WORKERS", "4"))    # documents embedding concurrently
+INSERT_WORKERS  = int(os.getenv("INGEST_INSERT_WORKERS", "2"))   # documents writing concurrently
+QUEUE_SIZE      = int(os.getenv("INGEST_QUEUE_SIZE", "2"))       # documents buffered between stages
+
+DONE = object()
+
+
+def chunk_extracted(markdown: str, document_name: str) -> list:
+    if not markdown or len(markdown.strip()) < 500:
+        raise ValueError("Extracted text too small or empty")
+    chunks = chunk_markdown_document(markdown=markdown, document_name=document_name)
+    if not chunks:
+        raise ValueError("No chunks produced")
+    return chunks
+
+
+def extract_and_chunk(pdf_path: str, document_name: str, fingerprint: str) -> tuple[list, dict, dict]:
+    """Runs in an extraction worker process. Returns (chunks, extraction, worker extractor stats)."""
+    markdown, extraction = extract_pdf(pdf_path, fingerprint, force=True)  # the caller already missed the cache
+    return chunk_extracted(markdown, document_name), extraction, extractor_stats()
+
+
+# ── Stages ────────────────────────────────────────────────────────────────────
+
+class Stage:
+    """`workers` threads taking jobs from `inbox`, applying `fn` and passing results to `outbox`."""
+
+    def __init__(self, name: str, fn, workers: int, inbox: queue.Queue, outbox: queue.Queue | None, on_error):
+        self.name     = name
+        self.fn       = fn
+        self.workers  = workers
+        self.inbox    = inbox
+        self.outbox   = outbox
+        self.on_error = on_error
+        self.items    = 0
+        self.busy     = 0.0   # seconds inside fn, summed over workers
+        self.blocked  = 0.0   # seconds waiting for room in outbox (backpressure from the next stage)
+        self._lock = threading.Lock()
+        self._remaining = workers
+        self.threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True) for i in range(workers)
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def _run(self):
+        while True:
+            job = self.inbox.get()
+            if job is DONE:
+                self.inbox.put(DONE)  # let sibling workers see it too
+                break
+
+            started = time.perf_counter()
+            try:
+                result = self.fn(job)
+            except Exception as e:
+                self.on_error(job, self.name, e)
+                result = None
+            elapsed = time.perf_counter() - started
+
+            waited = 0.0
+            if result is not None and self.outbox is not None:
+                started = time.perf_counter()
+                self.outbox.put(result)
+                waited = time.perf_counter() - started
+
+            with self._lock:
+                self.items += 1
+                self.busy += elapsed
+                self.blocked += waited
+
+        with self._lock:
+            self._remaining -= 1
+            last = self._remaining == 0
+        if last and self.outbox is not None:
+            self.outbox.put(DONE)
+
+
+# ── Run ───────────────────────────────────────────────────────────────────────
+
+def run_pipeline(
+    pdf_folder: str,
+    extract_workers: int = EXTRACT_WORKERS,
+    embed_workers: int = EMBED_WORKERS,
+    insert_workers: int = INSERT_WORKERS,
+    queue_size: int = QUEUE_SIZE,
+    incremental: bool = INCREMENTAL,
+    force_extract: bool = FORCE_EXTRACT,
+    rechunk: bool = False,
+) -> dict:
+    if not os.path.isdir(pdf_folder):
+        raise ValueError(f"Not a directory: {pdf_folder}")
+
+    pdf_files = [f for f in sorted(os.listdir(pdf_folder)) if f.lower().endswith(".pdf")]
+    if not pdf_files:
+        print("No PDF files found. Nothing to ingest.")
+        return {}
+
+    print(
+        f"Starting pipelined ingestion of {len(pdf_files)} PDFs "
+        f"(extract={extract_workers}, embed={embed_workers}, insert={insert_workers}, queue={queue_size})...\n"
+    )
+
+    totals = {
+        "done": 0, "updated": 0, "failed": 0, "skipped": 0,
+        "pages": 0, "chunks": 0, "tokens": 0, "extract_cached": 0,
+    }
+    workers: dict[int, dict] = {}
+    lock = threading.Lock()
+
+    def fail(job: dict, stage: str, e: Exception):
+        print(f"❌ Failed ({stage}): {job['filename']} — {type(e).__name__}: {e}")
+        with lock:
+            totals["failed"] += 1
+        # A failed in-place update leaves the old version live — keep its status
+        status = job.get("previous_status") or "failed"
+        try:
+            update_document_status(document_id=job["document_id"], status=status, error_message=str(e))
+        except Exception as status_error:
+            print(f"WARN: could not mark {job['filename']} failed: {status_error}")
+
+    executor = ProcessPoolExecutor(
+        max_workers=extract_workers,
+        mp_context=multiprocessing.get_context("spawn"),  # CUDA can't be re-initialized in a forked child
+        initializer=init_extractor,
+    )
+
+    def extract(job: dict) -> dict:
+        cached = None if force_extract else load_extraction(job["fingerprint"])
+        if cached:
+            markdown, extraction = cached
+            job["chunks"] = chunk_extracted(markdown, job["document_name"])
+            with lock:
+                totals["extract_cached"] += 1
+        else:
+            job["chunks"], extraction, stats = executor.submit(
+                extract_and_chunk, job["path"], job["document_name"], job["fingerprint"],
+            ).result()
+            with lock:
+                workers[stats["pid"]] = stats
+        job["pages"] = extraction["pages"]
+        return job
+
+    def embed(job: dict) -> dict:
+        if job.get("previous_status"):
+            job["plan"] = plan_update(job["document_id"], job["chunks"])
+            job["chunks"] = job["plan"]["insert"]  # only new content is embedded
+        job["embeddings"], job["tokens"], _ = embed_chunks(job["chunks"]) if job["chunks"] else ([], 0, 0)
+        return job
+
+    def insert(job: dict) -> None:
+        if job.get("plan"):
+            counts = apply_update(job["plan"], job["embeddings"], job["fingerprint"])
+            inserted = counts["inserted"]
+            print(f"🔁 Updated: {job['filename']} ({describe(counts)}, {job['pages']} pages)")
+        else:
+            inserted = insert_chunks(job["chunks"], job["embeddings"], job["document_id"])["rows"]
+            update_document_status(document_id=job["document_id"], status="done")
+            print(f"✅ Success: {job['filename']} ({inserted} chunks, {job['pages']} pages)")
+        with lock:
+            totals["updated" if job.get("plan") else "done"] += 1
+            totals["pages"] += job["pages"]
+            totals["chunks"] += inserted
+            totals["tokens"] += job["tokens"]
+
+    to_extract = queue.Queue(maxsize=queue_size)
+    to_embed   = queue.Queue(maxsize=queue_size)
+    to_insert  = queue.Queue(maxsize=queue_size)
+    stages = [
+        Stage("extract", extract, extract_workers, to_extract, to_embed, fail),
+        Stage("embed",   embed,   embed_workers,   to_embed,   to_insert, fail),
+        Stage("insert",  insert,  insert_workers,  to_insert,  None,      fail),
+    ]
+
+    started = time.perf_counter()
+    feed_blocked = 0.0
+    with executor:
+        for stage in stages:
+            stage.start()
+
+        for filename in pdf_files:
+            job = {
+                "filename":      filename,
+                "path":          os.path.join(pdf_folder, filename),
+                "document_name": os.path.splitext(filename)[0],
+                "document_id":   str(uuid.uuid4()),
+            }
+            try:
+                fingerprint = compute_fingerprint(job["path"])
+                if not rechunk and document_exists_by_fingerprint(fingerprint):
+                    print(f"⏭️  Skipped (already ingested): {filename}")
+                    totals["skipped"] += 1
+                    continue
+                job["fingerprint"] = fingerprint
+                target = update_target(job["document_name"], fingerprint, incremental, rechunk)
+                if target:
+                    job["document_id"], job["previous_status"] = target
+                else:
+                    job["document_id"] = insert_document(
+                        document_id=job["document_id"],
+                        document_name=job["document_name"],
+                        fingerprint=fingerprint,
+                        status="processing",
+                    )
+            except Exception as e:
+                fail(job, "feed", e)
+                continue
+            put_started = time.perf_counter()
+            to_extract.put(job)
+            feed_blocked += time.perf_counter() - put_started
+
+        to_extract.put(DONE)
+        for stage in stages:
+            stage.join()
+
+    wall = time.perf_counter() - started
+    report = {
+        "documents":      len(pdf_files),
+        **totals,
+        "seconds":        round(wall, 1),
+        "pages_per_s":    round(totals["pages"] / wall, 2),
+        "chunks_per_s":   round(totals["chunks"] / wall, 2),
+        "tokens_per_s":   round(totals["tokens"] / wall, 1),
+        "feed_blocked_s": round(feed_blocked, 1),
+        "embedding":      embedder.stats(),
+        "bulk_load":      bulk_load_stats(),
+        "embedding_cache": embedding_cache_stats(),
+        "stages": {
+            stage.name: {
+                "workers":     stage.workers,
+                "items":       stage.items,
+                "busy_s":      round(stage.busy, 1),
+                "utilization": round(stage.busy / (wall * stage.workers), 2),
+                "blocked_s":   round(stage.blocked, 1),
+            }
+            for stage in stages
+        },
+    }
+    print_report(report)
+    print_extraction_summary(workers)
+    return report
+
+
+def print_report(report: dict):
+    print("\n" + "=" * 80)
+    print(
+        f"Pipeline: {report['documents']} PDFs — {report['done']} done, {report['updated']} updated, {report['failed']} failed, "
+        f"{report['skipped']} skipped in {report['seconds']}s"
+    )
+    print(f"Extraction cache: {report['extract_cached']} documents re-chunked without marker")
+    print(
+        f"Throughput: {report['pages_per_s']} pages/s · {report['chunks_per_s']} chunks/s · "
+        f"{report['tokens_per_s']:,} tokens/s"
+    )
+    print(f"{'stage':<10} {'workers':>8} {'items':>7} {'busy s':>9} {'util':>6} {'blocked s':>10}")
+    for name, stage in report["stages"].items():
+        print(
+            f"{name:<10} {stage['workers']:>8} {stage['items']:>7} {stage['busy_s']:>9} "
+            f"{stage['utilization']:>6.0%} {stage['blocked_s']:>10}"
+        )
+    print(f"{'feed':<10} {'':>8} {'':>7} {'':>9} {'':>6} {report['feed_blocked_s']:>10}")
+    embedding = report["embedding"]
+    print(
+        f"Embeddings API: {embedding['requests']} requests, {embedding['retries']} retries "
+        f"({embedding['rate_limited']} rate-limited), {embedding['throttled_s']:.1f}s waiting on the RPM/TPM budget"
+    )
+    cache = report["embedding_cache"]
+    if cache["enabled"]:
+        print(
+            f"Embedding cache: {cache['hit_rate']:.1%} hit rate ({cache['hits']} hits, {cache['misses']} misses), "
+            f"{cache['tokens_saved']:,} tokens saved, {cache['stored']} new entries"
+        )
+    else:
+        print("Embedding cache: disabled")
+    load = report["bulk_load"]
+    print(
+        f"COPY load: {load['rows']} rows, {load['bytes'] / 1e6:.1f} MB sent in {load['seconds']:.1f}s "
+        f"— {load['rows_per_s']:,} rows/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipelined PDF ingestion")
+    parser.add_argument("pdf_folder")
+    parser.add_argument("--extract-workers", type=int, default=EXTRACT_WORKERS)
+    parser.add_argument("--embed-workers",   type=int, default=EMBED_WORKERS)
+    parser.add_argument("--insert-workers",  type=int, default=INSERT_WORKERS)
+    parser.add_argument("--queue-size",      type=int, default=QUEUE_SIZE)
+    parser.add_argument("--incremental",     action="store_true", default=INCREMENTAL,
+                        help="Update changed PDFs in place (chunk diff) instead of adding a new document")
+    parser.add_argument("--rechunk",         action="store_true",
+                        help="Re-chunk already-ingested PDFs (from the extraction cache) and update them in place")
+    parser.add_argument("--force-extract",   action="store_true", default=FORCE_EXTRACT,
+                        help="Ignore the extraction cache and re-run marker")
+    args = parser.parse_args()
+    report = run_pipeline(
+        args.pdf_folder,
+        extract_workers=args.extract_workers,
+        embed_workers=args.embed_workers,
+        insert_workers=args.insert_workers,
+        queue_size=args.queue_size,
+        incremental=args.incremental,
+        force_extract=args.force_extract,
+        rechunk=args.rechunk,
+    )
+    sys.exit(1 if report.get("failed") else 0)
+
+
+if __name__ == "__main__":
+    main()
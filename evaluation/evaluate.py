@@ -23,6 +23,7 @@ Requirements:
 import os
 import sys
 import json
+import asyncio
 import argparse
 import datetime
 import time
@@ -43,6 +44,7 @@ from ragas.metrics import faithfulness, answer_relevancy, context_precision, con
 from app.final_retreval import retrieve_sql
 
 _openai = OpenAI()
+_loop   = asyncio.new_event_loop()  # one loop for the whole run — the async DB pool is bound to it
 
 DATASET_PATH = Path(__file__).parent / "dataset.json"
 RESULTS_DIR  = Path(__file__).parent / "results"
@@ -77,7 +79,7 @@ def nova_run(question: str) -> tuple[str, list[str]]:
     Runs the full NOVA retrieval + generation pipeline.
     Returns (answer, list_of_context_strings).
     """
-    retrieval = retrieve_sql(question)
+    retrieval = _loop.run_until_complete(retrieve_sql(question))
     contexts  = [item["text"] for _, item in retrieval.get("results", [])]
 
     if retrieval.get("mode") == "none" or not contexts:
@@ -0,0 +1,244 @@
+"""
+NOVA load generator
+===================
+Drives /chat or /chat/stream on a running API server and reports throughput,
+latency percentiles, time-to-first-token (stream) and error rates.
+
+Arrival modes:
+  closed loop  --concurrency N       N virtual users, each sends its next request when the last one finishes
+  open loop    --rate R              Poisson arrivals at R requests/s, regardless of how fast the server answers
+                                     (the mode that exposes queueing — latency climbs once R passes capacity)
+
+--sweep 1,2,4,8,16 repeats a closed-loop run per concurrency level (or a
+Poisson run per rate with --rate-sweep) and prints one row each, which is how
+to find where throughput flattens and p99 takes off — the pool/threadpool
+saturation point. With --admin-secret the server's /admin/metrics pool gauges
+are sampled after each step.
+
+Typical offline setup (no OpenAI/Cohere quota spent):
+    uvicorn loadtest.stub_apis:app --port 9000 --workers 2
+    python -m loadtest.seed_db --reset
+    OPENAI_BASE_URL=http://localhost:9000/v1 CO_API_URL=http://localhost:9000 uvicorn app.main:app --port 8000
+    python -m loadtest.run --endpoint stream --sweep 1,4,16,32 --duration 30
+
+Set ANSWER_CACHE_SIZE=0 on the server (or use --unique) so the answer cache
+doesn't turn the run into a cache benchmark.
+"""
+
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from pathlib import Path
+
+import httpx
+
+ROOT    = Path(__file__).parent.parent
+DATASET = ROOT / "evaluation" / "Dataset.json"
+
+
+class Results:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.ttfts: list[float]     = []
+        self.errors: dict[str, int] = {}
+        self.ok = 0
+        self.started = self.finished = 0.0
+
+    def error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def load_questions(path: str | None) -> list[str]:
+    if path:
+        return [line.strip() for line in Path(path).read_text().splitlines() if line.strip()]
+    return [row["question"] for row in json.loads(DATASET.read_text())]
+
+
+# ── One request ───────────────────────────────────────────────────────────────
+
+async def send(client: httpx.AsyncClient, endpoint: str, question: str, results: Results, stream_params: dict):
+    started = time.perf_counter()
+    try:
+        if endpoint == "chat":
+            response = await client.post("/chat", json={"message": question})
+            if response.status_code != 200:
+                results.error(f"http_{response.status_code}")
+                return
+            if response.json().get("reply") == "An internal error occurred.":
+                results.error("app_error")
+                return
+        else:
+            first_token = None
+            async with client.stream("POST", "/chat/stream", json={"message": question}, params=stream_params) as response:
+                if response.status_code != 200:
+                    results.error(f"http_{response.status_code}")
+                    return
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[7:]
+                    elif event == "token" and first_token is None:
+                        first_token = time.perf_counter()
+                    elif event == "error" and line.startswith("data: "):
+                        results.error("app_error")
+                        return
+            if first_token is None:
+                results.error("no_tokens")
+                return
+            results.ttfts.append(first_token - started)
+    except httpx.TimeoutException:
+        results.error("timeout")
+        return
+    except httpx.HTTPError as e:
+        results.error(type(e).__name__)
+        return
+    results.latencies.append(time.perf_counter() - started)
+    results.ok += 1
+
+
+# ── Arrival modes ─────────────────────────────────────────────────────────────
+
+def _question(questions: list[str], unique: bool) -> str:
+    question = random.choice(questions)
+    return f"{question} ({uuid.uuid4().hex[:6]})" if unique else question
+
+
+async def closed_loop(client, args, questions, concurrency: int) -> Results:
+    results = Results()
+    deadline = time.perf_counter() + args.duration
+
+    async def user():
+        while time.perf_counter() < deadline:
+            await send(client, args.endpoint, _question(questions, args.unique), results, args.stream_params)
+
+    results.started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    results.finished = time.perf_counter()
+    return results
+
+
+async def open_loop(client, args, questions, rate: float) -> Results:
+    results = Results()
+    in_flight: set[asyncio.Task] = set()
+    results.started = time.perf_counter()
+    deadline = results.started + args.duration
+    next_at = results.started
+    while True:
+        next_at += random.expovariate(rate)
+        if next_at >= deadline:
+            break
+        await asyncio.sleep(max(next_at - time.perf_counter(), 0))
+        task = asyncio.create_task(send(client, args.endpoint, _question(questions, args.unique), results, args.stream_params))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    results.finished = time.perf_counter()
+    return results
+
+
+# ── Reporting ─────────────────────────────────────────────────────────────────
+
+async def pool_gauges(client: httpx.AsyncClient, secret: str) -> str:
+    try:
+        response = await client.get("/admin/metrics", headers={"X-Admin-Secret": secret})
+    except httpx.HTTPError:
+        return "metrics unavailable"
+    # nova_db_pool_connections{pool="async",state="in_use"} 3  →  async.in_use=3
+    gauges = []
+    for line in response.text.splitlines():
+        if line.startswith("nova_db_pool_connections{"):
+            labels, value = line[len("nova_db_pool_connections{"):].split("} ")
+            pool, state = (part.split("=")[1].strip('"') for part in labels.split(","))
+            gauges.append(f"{pool}.{state}={value}")
+    return " ".join(gauges)
+
+
+def summarize(label: str, results: Results) -> dict:
+    elapsed = max(results.finished - results.started, 1e-9)
+    total = results.ok + sum(results.errors.values())
+    return {
+        "load":       label,
+        "requests":   total,
+        "throughput": round(results.ok / elapsed, 2),
+        "p50_ms":     round(percentile(results.latencies, 0.50) * 1000, 1),
+        "p95_ms":     round(percentile(results.latencies, 0.95) * 1000, 1),
+        "p99_ms":     round(percentile(results.latencies, 0.99) * 1000, 1),
+        "ttft_p50_ms": round(percentile(results.ttfts, 0.50) * 1000, 1),
+        "ttft_p95_ms": round(percentile(results.ttfts, 0.95) * 1000, 1),
+        "error_rate": round(sum(results.errors.values()) / total, 4) if total else 0.0,
+        "errors":     results.errors,
+    }
+
+
+def print_row(row: dict, header: bool):
+    columns = ["load", "requests", "throughput", "p50_ms", "p95_ms", "p99_ms", "ttft_p50_ms", "ttft_p95_ms", "error_rate"]
+    if header:
+        print("  ".join(f"{c:>12}" for c in columns))
+    print("  ".join(f"{str(row[c]):>12}" for c in columns) + (f"  {row['errors']}" if row["errors"] else ""))
+
+
+async def main_async(args):
+    questions = load_questions(args.questions)
+    if args.rate_sweep:
+        steps = [("rate", float(x)) for x in args.rate_sweep.split(",")]
+    elif args.sweep:
+        steps = [("concurrency", int(x)) for x in args.sweep.split(",")]
+    elif args.rate:
+        steps = [("rate", args.rate)]
+    else:
+        steps = [("concurrency", args.concurrency)]
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    rows = []
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        for i, (mode, level) in enumerate(steps):
+            if mode == "rate":
+                results = await open_loop(client, args, questions, level)
+                label = f"{level:g}/s"
+            else:
+                results = await closed_loop(client, args, questions, level)
+                label = f"c={level}"
+            row = summarize(label, results)
+            rows.append(row)
+            print_row(row, header=i == 0)
+            if args.admin_secret:
+                print(f"{'':>12}  pools: {await pool_gauges(client, args.admin_secret)}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"endpoint": args.endpoint, "steps": rows}, indent=2))
+        print(f"Saved → {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /chat and /chat/stream")
+    parser.add_argument("--url",          default="http://localhost:8000")
+    parser.add_argument("--endpoint",     choices=["chat", "stream"], default="chat")
+    parser.add_argument("--concurrency",  type=int, default=8, help="Closed-loop virtual users")
+    parser.add_argument("--rate",         type=float, help="Open-loop Poisson arrival rate (requests/s)")
+    parser.add_argument("--sweep",        help="Comma-separated concurrency levels, e.g. 1,4,16,64")
+    parser.add_argument("--rate-sweep",   help="Comma-separated Poisson rates, e.g. 2,5,10,20")
+    parser.add_argument("--duration",     type=float, default=30, help="Seconds per step")
+    parser.add_argument("--timeout",      type=float, default=60)
+    parser.add_argument("--questions",    help="File with one question per line (default: evaluation/Dataset.json)")
+    parser.add_argument("--unique",       action="store_true", help="Suffix questions so the answer cache never hits")
+    parser.add_argument("--coalesce-ms",  type=int, default=0, help="/chat/stream frame coalescing window")
+    parser.add_argument("--admin-secret", help="Sample /admin/metrics pool gauges after each step")
+    parser.add_argument("--output",       help="Write the report as JSON")
+    args = parser.parse_args()
+    args.stream_params = {"coalesce_ms": args.coalesce_ms} if args.coalesce_ms else {}
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Stub OpenAI + Cohere APIs for load testing
+==========================================
+Serves the three upstream calls the chat path makes, with no quota spent:
+
+  POST /v1/embeddings         — OpenAI embeddings (float or base64 encoding)
+  POST /v1/chat/completions   — OpenAI chat completions, streamed or not
+  POST /v1/rerank             — Cohere rerank
+
+Latencies are drawn from a lognormal distribution around a configurable
+median; streamed completions emit tokens at STUB_TOKENS_PER_SEC after a
+STUB_TTFT_MS delay. Embeddings are deterministic hashed bag-of-words vectors
+(fake_embedding), so chunks seeded with the same function give meaningful
+vector search results.
+
+Run:
+    uvicorn loadtest.stub_apis:app --port 9000 --workers 2
+
+Point the API server at it:
+    OPENAI_BASE_URL=http://localhost:9000/v1 CO_API_URL=http://localhost:9000 uvicorn app.main:app
+"""
+
+import os
+import re
+import json
+import math
+import time
+import base64
+import random
+import asyncio
+import hashlib
+from array import array
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_EMBED_MS       = float(os.getenv("STUB_EMBED_MS", "120"))     # median latency per embeddings call
+STUB_RERANK_MS      = float(os.getenv("STUB_RERANK_MS", "180"))
+STUB_COMPLETION_MS  = float(os.getenv("STUB_COMPLETION_MS", "1500"))  # non-streamed completion
+STUB_TTFT_MS        = float(os.getenv("STUB_TTFT_MS", "400"))      # streamed: delay before first token
+STUB_TOKENS_PER_SEC = float(os.getenv("STUB_TOKENS_PER_SEC", "80"))
+STUB_REPLY_TOKENS   = int(os.getenv("STUB_REPLY_TOKENS", "150"))
+STUB_JITTER         = float(os.getenv("STUB_JITTER", "0.35"))      # lognormal sigma; 0 → fixed latency
+STUB_ERROR_RATE     = float(os.getenv("STUB_ERROR_RATE", "0"))     # fraction of calls answered 429
+EMBED_DIMS          = 3072
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_REPLY_WORDS = (
+    "According to the regulations students must maintain the required attendance in each course "
+    "and fees are payable per semester as listed in the table below for every programme"
+).split()
+
+app = FastAPI()
+
+
+def fake_embedding(text: str, dims: int = EMBED_DIMS) -> list[float]:
+    """Hashed bag-of-words, L2-normalized — texts sharing words get a high cosine similarity."""
+    vec = [0.0] * dims
+    for word in _WORD_RE.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+        h = int.from_bytes(digest, "little")
+        vec[h % dims] += 1.0 if (h >> 63) else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+async def _delay(median_ms: float):
+    jitter = random.lognormvariate(0, STUB_JITTER) if STUB_JITTER > 0 else 1.0
+    await asyncio.sleep(median_ms * jitter / 1000)
+
+
+def _rate_limited() -> JSONResponse | None:
+    if STUB_ERROR_RATE > 0 and random.random() < STUB_ERROR_RATE:
+        return JSONResponse(status_code=429, content={"error": {"message": "stub rate limit", "type": "rate_limit"}})
+    return None
+
+
+# ── OpenAI ────────────────────────────────────────────────────────────────────
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    if (error := _rate_limited()) is not None:
+        return error
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    dims = body.get("dimensions") or EMBED_DIMS
+    await _delay(STUB_EMBED_MS)
+
+    data = []
+    for i, text in enumerate(inputs):
+        vec = fake_embedding(text, dims)
+        if body.get("encoding_format") == "base64":
+            vec = base64.b64encode(array("f", vec).tobytes()).decode()
+        data.append({"object": "embedding", "index": i, "embedding": vec})
+    tokens = sum(len(text.split()) for text in inputs)
+    return {
+        "object": "list", "data": data, "model": body.get("model", "stub"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+def _reply_tokens() -> list[str]:
+    return [(" " if i else "") + _REPLY_WORDS[i % len(_REPLY_WORDS)] for i in range(STUB_REPLY_TOKENS)]
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if (error := _rate_limited()) is not None:
+        return error
+    model = body.get("model", "stub")
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await _delay(STUB_COMPLETION_MS)
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": created, "model": model,
+            "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "".join(_reply_tokens())},
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": STUB_REPLY_TOKENS, "total_tokens": STUB_REPLY_TOKENS},
+        }
+
+    def chunk(delta: dict, finish_reason=None) -> str:
+        return "data: " + json.dumps({
+            "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }) + "\n\n"
+
+    async def stream():
+        await _delay(STUB_TTFT_MS)
+        yield chunk({"role": "assistant", "content": ""})
+        interval = 1 / STUB_TOKENS_PER_SEC if STUB_TOKENS_PER_SEC > 0 else 0
+        for token in _reply_tokens():
+            yield chunk({"content": token})
+            await asyncio.sleep(interval)
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+# ── Cohere ────────────────────────────────────────────────────────────────────
+
+@app.post("/v1/rerank")
+@app.post("/v2/rerank")
+async def rerank(request: Request):
+    body = await request.json()
+    if (error := _rate_limited()) is not None:
+        return error
+    await _delay(STUB_RERANK_MS)
+
+    # Word overlap with the query stands in for a cross-encoder score
+    query_words = set(_WORD_RE.findall(body["query"].lower()))
+    results = []
+    for i, doc in enumerate(body["documents"]):
+        text = doc if isinstance(doc, str) else doc.get("text", "")
+        words = set(_WORD_RE.findall(text.lower()))
+        overlap = len(query_words & words) / (len(query_words) or 1)
+        results.append({"index": i, "relevance_score": round(0.2 + 0.8 * overlap, 4)})
+    results.sort(key=lambda r: r["relevance_score"], reverse=True)
+    top_n = body.get("top_n") or len(results)
+    return {"id": "rerank-stub", "results": results[:top_n], "meta": {"api_version": {"version": "1"}}}
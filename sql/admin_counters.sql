@@ -0,0 +1,116 @@
+-- Incrementally maintained counters for the admin dashboard
+-- =========================================================
+-- /admin/stats reads corpus_counters instead of COUNT(*)-ing document_chunks,
+-- and /admin/documents reads documents.chunk_count instead of joining every
+-- chunk. Triggers keep both in step with inserts/deletes; chunk triggers are
+-- statement-level with transition tables, so a bulk insert of N chunks costs
+-- one counter update per document rather than N.
+--
+-- Idempotent — safe to re-run; the final block recomputes every counter.
+--   psql "$SUPABASE_URL" -f sql/admin_counters.sql
+-- (TRUNCATE bypasses the triggers; re-run this file afterwards.)
+
+CREATE TABLE IF NOT EXISTS corpus_counters (
+    name  TEXT PRIMARY KEY,            -- 'chunks' or 'documents:<status>'
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS chunk_count INTEGER NOT NULL DEFAULT 0;
+
+-- The keyset cursor is (updated_at, document_id): a NULL updated_at can't be
+-- encoded and never compares below a cursor, so such rows would be skipped.
+-- Backfill from created_at and keep it set from now on.
+UPDATE documents SET updated_at = COALESCE(created_at, now()) WHERE updated_at IS NULL;
+ALTER TABLE documents ALTER COLUMN updated_at SET DEFAULT now();
+ALTER TABLE documents ALTER COLUMN updated_at SET NOT NULL;
+
+-- Keyset pagination for /admin/documents (ORDER BY updated_at DESC, document_id DESC),
+-- optionally filtered by status; also serves MAX(updated_at) WHERE status = 'done'
+CREATE INDEX IF NOT EXISTS documents_updated_idx
+    ON documents (updated_at DESC, document_id DESC);
+CREATE INDEX IF NOT EXISTS documents_status_updated_idx
+    ON documents (status, updated_at DESC, document_id DESC);
+
+
+-- ── Chunk counts ─────────────────────────────────────────────────────────────
+
+CREATE OR REPLACE FUNCTION count_inserted_chunks() RETURNS trigger AS $$
+BEGIN
+    UPDATE documents d
+    SET chunk_count = d.chunk_count + n.added
+    FROM (SELECT document_id, COUNT(*) AS added FROM new_rows GROUP BY document_id) n
+    WHERE d.document_id = n.document_id;
+
+    INSERT INTO corpus_counters (name, value)
+    SELECT 'chunks', COUNT(*) FROM new_rows
+    ON CONFLICT (name) DO UPDATE SET value = corpus_counters.value + EXCLUDED.value;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION count_deleted_chunks() RETURNS trigger AS $$
+BEGIN
+    UPDATE documents d
+    SET chunk_count = GREATEST(d.chunk_count - o.removed, 0)
+    FROM (SELECT document_id, COUNT(*) AS removed FROM old_rows GROUP BY document_id) o
+    WHERE d.document_id = o.document_id;
+
+    UPDATE corpus_counters
+    SET value = GREATEST(value - (SELECT COUNT(*) FROM old_rows), 0)
+    WHERE name = 'chunks';
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS document_chunks_count_insert ON document_chunks;
+CREATE TRIGGER document_chunks_count_insert
+AFTER INSERT ON document_chunks
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION count_inserted_chunks();
+
+DROP TRIGGER IF EXISTS document_chunks_count_delete ON document_chunks;
+CREATE TRIGGER document_chunks_count_delete
+AFTER DELETE ON document_chunks
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION count_deleted_chunks();
+
+
+-- ── Documents per status ─────────────────────────────────────────────────────
+
+CREATE OR REPLACE FUNCTION count_document_status() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE corpus_counters SET value = value - 1 WHERE name = 'documents:' || OLD.status;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO corpus_counters (name, value) VALUES ('documents:' || NEW.status, 1)
+        ON CONFLICT (name) DO UPDATE SET value = corpus_counters.value + 1;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS documents_count_status ON documents;
+CREATE TRIGGER documents_count_status
+AFTER INSERT OR DELETE OR UPDATE OF status ON documents
+FOR EACH ROW EXECUTE FUNCTION count_document_status();
+
+
+-- ── Backfill ─────────────────────────────────────────────────────────────────
+
+BEGIN;
+LOCK TABLE documents, document_chunks IN SHARE ROW EXCLUSIVE MODE;
+
+UPDATE documents d
+SET chunk_count = COALESCE(c.n, 0)
+FROM documents d2
+LEFT JOIN (SELECT document_id, COUNT(*) AS n FROM document_chunks GROUP BY document_id) c
+    ON c.document_id = d2.document_id
+WHERE d.document_id = d2.document_id AND d.chunk_count IS DISTINCT FROM COALESCE(c.n, 0);
+
+DELETE FROM corpus_counters;
+INSERT INTO corpus_counters (name, value)
+SELECT 'chunks', COUNT(*) FROM document_chunks
+UNION ALL
+SELECT 'documents:' || status, COUNT(*) FROM documents GROUP BY status;
+COMMIT;
@@ -0,0 +1,21 @@
+-- Persistent embedding cache for ingestion
+-- ========================================
+-- Embeddings keyed by the SHA-256 of the exact (token-truncated) text sent to
+-- the API, plus model and dimensions. Ingestion looks chunks up here before
+-- calling the embeddings API, so re-ingesting a mostly unchanged PDF or
+-- re-chunking with different parameters only pays for genuinely new text.
+--
+-- `embedding` is an unconstrained vector so one table can hold several
+-- models/dimensions; the key keeps them apart.
+--
+-- Idempotent — safe to re-run.
+--   psql "$SUPABASE_URL" -f sql/embedding_cache.sql
+
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    text_sha256 BYTEA       NOT NULL,
+    model       TEXT        NOT NULL,
+    dims        INTEGER     NOT NULL,
+    embedding   vector      NOT NULL,
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (text_sha256, model, dims)
+);